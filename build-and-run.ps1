@@ -23,8 +23,10 @@ try {
     # Ignore errors if no containers are running
 }
 
-# Build the Docker image
+# Build the Docker image (BuildKit is required for the pip cache mount)
 Write-Host "🔨 Building Docker image..." -ForegroundColor Yellow
+$env:DOCKER_BUILDKIT = "1"
+$env:COMPOSE_DOCKER_CLI_BUILD = "1"
 docker build -t trustlayer-ai:latest .
 
 # Tag for GCR (optional, for future pushes)
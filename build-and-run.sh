@@ -21,8 +21,10 @@ echo "Redis Endpoint: 10.97.237.131:6379"
 echo "🛑 Stopping existing containers..."
 docker-compose down 2>/dev/null || true
 
-# Build the Docker image
+# Build the Docker image (BuildKit is required for the pip cache mount)
 echo "🔨 Building Docker image..."
+export DOCKER_BUILDKIT=1
+export COMPOSE_DOCKER_CLI_BUILD=1
 docker build -t trustlayer-ai:latest .
 
 # Tag for GCR (optional, for future pushes)
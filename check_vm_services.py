@@ -13,10 +13,11 @@ def ssh_command(external_ip, command, description=""):
     print(f"🔧 {description}")
     print(f"   Command: {command}")
     
-    ssh_cmd = f'ssh -o ConnectTimeout=10 -o StrictHostKeyChecking=no {external_ip} "{command}"'
+    # The remote command is a single argument; only the VM's shell parses it
+    ssh_cmd = ["ssh", "-o", "ConnectTimeout=10", "-o", "StrictHostKeyChecking=no", external_ip, command]
     
     try:
-        result = subprocess.run(ssh_cmd, shell=True, capture_output=True, text=True, timeout=30)
+        result = subprocess.run(ssh_cmd, capture_output=True, text=True, timeout=30)
         if result.returncode == 0:
             print(f"   ✅ Success")
             if result.stdout.strip():
@@ -7,6 +7,7 @@ Run this from Google Cloud Shell or SSH into the VM
 
 import subprocess
 import sys
+from itertools import islice
 
 def run_command(command, description=""):
     """Run shell command and return result"""
@@ -18,7 +19,7 @@ def run_command(command, description=""):
         if result.returncode == 0:
             print(f"   ✅ Success")
             if result.stdout.strip():
-                for line in result.stdout.strip().split('\n')[:5]:  # Show first 5 lines
+                for line in islice(result.stdout.strip().splitlines(), 5):  # Show first 5 lines
                     print(f"      {line}")
             return True, result.stdout.strip()
         else:
@@ -3,6 +3,7 @@ TrustLayer AI: Streamlit Dashboard
 Real-time visualization of traffic flow, PII blocking, and compliance status
 """
 import streamlit as st
+from streamlit_autorefresh import st_autorefresh
 import requests
 import pandas as pd
 import plotly.express as px
@@ -52,6 +53,14 @@ def get_proxy_url():
 
 PROXY_URL = get_proxy_url()
 
+# Auto-refresh backs off from 30s to 2 minutes while nothing changes
+REFRESH_INTERVAL_MS = 30_000
+MAX_REFRESH_INTERVAL_MS = 120_000
+
+# The dashboard's own polls are logged by the proxy as well and must not
+# count as activity, otherwise an open dashboard would never look idle
+DASHBOARD_PATHS = {"/health", "/metrics"}
+
 # Page configuration
 st.set_page_config(
     page_title="TrustLayer AI Dashboard",
@@ -170,24 +179,46 @@ def get_metrics():
         st.error(f"Failed to fetch metrics: {e}")
         return None
 
+def parse_timestamps(series):
+    """Parse the proxy's ISO8601 timestamps without per-row format inference"""
+    return pd.to_datetime(series, format='ISO8601', utc=True, cache=True)
+
+def metrics_signature(metrics):
+    """Summarize the metrics that reflect real proxy activity"""
+    if not metrics:
+        return None
+    latest_activity = next(
+        (req['timestamp'] for req in metrics['traffic']['recent_requests']
+         if req.get('path') not in DASHBOARD_PATHS),
+        None
+    )
+    return (metrics['summary']['total_pii_entities_blocked'], latest_activity)
+
+def next_refresh_interval(metrics):
+    """Extend the refresh interval while metrics are idle, reset it on activity"""
+    sig = metrics_signature(metrics)
+    if sig != st.session_state.get("metrics_sig"):
+        st.session_state["metrics_sig"] = sig
+        st.session_state["idle_intervals"] = 0
+    else:
+        st.session_state["idle_intervals"] = st.session_state.get("idle_intervals", 0) + 1
+    
+    idle = st.session_state["idle_intervals"]
+    return min(MAX_REFRESH_INTERVAL_MS, REFRESH_INTERVAL_MS * (1 + idle))
+
 def main():
     st.title("🛡️ TrustLayer AI: Master Builder Dashboard")
     st.markdown("**Production-Ready AI Governance Transparent Proxy**")
     
     # Sidebar
     st.sidebar.title("Dashboard Controls")
-    auto_refresh = st.sidebar.checkbox("Auto Refresh (30s)", value=True)
+    auto_refresh = st.sidebar.checkbox("Auto Refresh (30s–2m, adaptive)", value=True)
+    
+    metrics = render_dashboard()
     
     if auto_refresh:
-        # Auto-refresh every 30 seconds
-        placeholder = st.empty()
-        
-        while True:
-            with placeholder.container():
-                render_dashboard()
-            time.sleep(30)
-    else:
-        render_dashboard()
+        # Schedule the next rerun client-side instead of blocking on time.sleep
+        st_autorefresh(interval=next_refresh_interval(metrics), key="metrics_refresh")
 
 def test_proxy_connection():
     """Test connection to the proxy"""
@@ -205,7 +236,7 @@ def test_proxy_connection():
         return False, str(e)
 
 def render_dashboard():
-    """Render the main dashboard"""
+    """Render the main dashboard and return the metrics it was built from"""
     
     # Test connection first
     connected, status = test_proxy_connection()
@@ -231,7 +262,7 @@ uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
         if st.button("🔄 Retry Connection", key=retry_key):
             st.rerun()
         
-        return
+        return None
     
     # Show connection status
     st.success(f"✅ Connected to TrustLayer AI Proxy ({PROXY_URL})")
@@ -241,7 +272,7 @@ uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
     
     if not metrics:
         st.warning("⚠️ Could not fetch metrics from proxy")
-        return
+        return None
     
     # Summary metrics
     col1, col2, col3, col4 = st.columns(4)
@@ -390,7 +421,7 @@ uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
         if metrics['security']['recent_pii_events']:
             pii_events = metrics['security']['recent_pii_events']
             pii_df = pd.DataFrame(pii_events)
-            pii_df['timestamp'] = pd.to_datetime(pii_df['timestamp'])
+            pii_df['timestamp'] = parse_timestamps(pii_df['timestamp'])
             
             fig = px.line(
                 pii_df,
@@ -445,7 +476,7 @@ uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
     if metrics['traffic']['recent_requests']:
         st.subheader("Recent Requests")
         requests_df = pd.DataFrame(metrics['traffic']['recent_requests'])
-        requests_df['timestamp'] = pd.to_datetime(requests_df['timestamp'])
+        requests_df['timestamp'] = parse_timestamps(requests_df['timestamp'])
         requests_df['latency_ms'] = requests_df['latency'] * 1000
         
         st.dataframe(
@@ -457,7 +488,7 @@ uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
     if metrics['security']['recent_pii_events']:
         st.subheader("Recent PII Protection Events")
         pii_df = pd.DataFrame(metrics['security']['recent_pii_events'])
-        pii_df['timestamp'] = pd.to_datetime(pii_df['timestamp'])
+        pii_df['timestamp'] = parse_timestamps(pii_df['timestamp'])
         
         st.dataframe(
             pii_df[['timestamp', 'session_id', 'entities_redacted']],
@@ -470,6 +501,8 @@ uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
         f"**TrustLayer AI Dashboard** | Last Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | "
         f"Proxy Status: {'🟢 Online' if metrics else '🔴 Offline'}"
     )
+    
+    return metrics
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,90 +2,181 @@
 """
 Diagnose VM Services - Check what's running on the TrustLayer AI VM
 Run this script from Google Cloud Shell or a machine with gcloud CLI
+Uses paramiko when it is installed, otherwise the ssh binary
 """
 
+import asyncio
+import atexit
+import os
+import socket
 import subprocess
 import sys
 import json
+import textwrap
 
-def run_ssh_command(vm_ip, command, description=""):
-    """Run command via SSH on the VM"""
-    print(f"🔍 {description}")
-    print(f"   Command: {command}")
+try:
+    import paramiko
+except ImportError:
+    paramiko = None
+
+# Every check rides one multiplexed SSH connection instead of paying a full
+# handshake each; the channels count against sshd's MaxSessions (default 10)
+SSH_CONTROL_PATH = "/tmp/tl-ssh-%r@%h:%p"
+
+# Fail within seconds on an unreachable or silent VM instead of waiting out each check
+SSH_CONNECT_TIMEOUT = 3
+SSH_KEEPALIVE_OPTIONS = ["-o", f"ConnectTimeout={SSH_CONNECT_TIMEOUT}",
+                         "-o", "ServerAliveInterval=2", "-o", "ServerAliveCountMax=2"]
+
+# Per-check deadlines in seconds; the fast one only applies once a shared connection
+# is up, since a check that has to do its own handshake and auth can't finish in 2s
+FAST_CHECK_TIMEOUT = 2
+SLOW_CHECK_TIMEOUT = 10
+
+_ssh_masters = {}
+
+async def start_ssh_master(vm_ip):
+    """Open a background SSH master connection for later commands to reuse; True if it is up"""
+    if vm_ip in _ssh_masters:
+        return _ssh_masters[vm_ip]
+    
+    master_command = ["ssh", "-o", "ControlMaster=auto", "-o", f"ControlPath={SSH_CONTROL_PATH}",
+                      "-o", "ControlPersist=60s", "-o", "StrictHostKeyChecking=no",
+                      *SSH_KEEPALIVE_OPTIONS, "-Nf", vm_ip]
+    # -f backgrounds the master after auth; its output goes to /dev/null so nothing
+    # waits on pipes the background process keeps open
+    proc = await asyncio.create_subprocess_exec(
+        *master_command, stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        up = await asyncio.wait_for(proc.wait(), timeout=SLOW_CHECK_TIMEOUT) == 0
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        up = False
+    
+    if up:
+        atexit.register(stop_ssh_master, vm_ip)
+    else:
+        # Commands fall back to their own connections if no master is listening
+        print("⚠️  SSH master connection failed, each check will connect on its own")
+    _ssh_masters[vm_ip] = up
+    return up
+
+def stop_ssh_master(vm_ip):
+    """Tear down the background SSH master connection"""
+    subprocess.run(["ssh", "-o", f"ControlPath={SSH_CONTROL_PATH}", "-O", "exit", vm_ip],
+                   capture_output=True, text=True)
+
+# With paramiko, each check is a channel on one in-process connection
+_ssh_clients = {}
+
+def connect_ssh_client(vm_ip):
+    """Open the paramiko connection used for all checks, if paramiko is available"""
+    if paramiko is None or vm_ip in _ssh_clients:
+        return
     
-    ssh_command = f'ssh -o StrictHostKeyChecking=no {vm_ip} "{command}"'
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        client.connect(vm_ip, username=os.getenv("USER"), timeout=SSH_CONNECT_TIMEOUT)
+    except Exception as e:
+        print(f"⚠️  paramiko connection failed ({e}), falling back to the ssh binary")
+        client.close()
+        return
+    
+    _ssh_clients[vm_ip] = client
+    atexit.register(client.close)
+
+def exec_ssh_channel(client, command, timeout):
+    """Run command on a new channel of an open paramiko connection"""
+    stdin, stdout, stderr = client.exec_command(command, timeout=timeout)
+    out = stdout.read().decode(errors="replace")
+    err = stderr.read().decode(errors="replace")
+    return stdout.channel.recv_exit_status(), out, err
+
+async def exec_ssh(vm_ip, command, timeout):
+    """Run command on the VM and return (returncode, stdout, stderr)"""
+    client = _ssh_clients.get(vm_ip)
+    if client is not None:
+        return await asyncio.to_thread(exec_ssh_channel, client, command, timeout)
+    
+    # The remote command is a single argument; only the VM's shell parses it
+    ssh_command = ["ssh", "-o", f"ControlPath={SSH_CONTROL_PATH}",
+                   "-o", "StrictHostKeyChecking=no", *SSH_KEEPALIVE_OPTIONS, vm_ip, command]
+    
+    proc = await asyncio.create_subprocess_exec(
+        *ssh_command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+async def run_ssh_command(vm_ip, command, description="", timeout=SLOW_CHECK_TIMEOUT):
+    """Run command via SSH on the VM, returning its result and report lines"""
+    report = [f"🔍 {description}", f"   Command: {command}"]
     
     try:
-        result = subprocess.run(ssh_command, shell=True, capture_output=True, text=True, timeout=30)
-        if result.returncode == 0:
-            print(f"   ✅ Success:")
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    print(f"      {line}")
-            return True, result.stdout.strip()
+        try:
+            returncode, stdout, stderr = await exec_ssh(vm_ip, command, timeout=timeout)
+        except (asyncio.TimeoutError, socket.timeout):
+            report.append(f"   ❌ Command timed out")
+            return False, "Timeout", report
+        
+        if returncode == 0:
+            report.append(f"   ✅ Success:")
+            report.append(textwrap.indent(stdout.strip(), "      "))
+            return True, stdout.strip(), report
         else:
-            print(f"   ❌ Failed:")
-            for line in result.stderr.strip().split('\n'):
-                if line.strip():
-                    print(f"      {line}")
-            return False, result.stderr.strip()
-    except subprocess.TimeoutExpired:
-        print(f"   ❌ Command timed out")
-        return False, "Timeout"
+            report.append(f"   ❌ Failed:")
+            report.append(textwrap.indent(stderr.strip(), "      "))
+            return False, stderr.strip(), report
     except Exception as e:
-        print(f"   ❌ Error: {e}")
-        return False, str(e)
+        report.append(f"   ❌ Error: {e}")
+        return False, str(e), report
+
+# Independent read-only checks (command, description, timeout), run
+# concurrently and reported in this order
+DIAGNOSTIC_CHECKS = [
+    ("sudo netstat -tlnp | grep -E ':(80|8000|8501)\\s'",
+     "Checking what's listening on ports 80, 8000, 8501", FAST_CHECK_TIMEOUT),
+    ("docker ps", "Checking Docker containers", SLOW_CHECK_TIMEOUT),
+    ("cd /opt/trustlayer-ai && docker-compose ps", "Checking docker-compose status", SLOW_CHECK_TIMEOUT),
+    ("curl -s http://localhost:8000/health", "Testing TrustLayer AI health locally", FAST_CHECK_TIMEOUT),
+    ("curl -I http://localhost:8501", "Testing dashboard locally", FAST_CHECK_TIMEOUT),
+    ("sudo systemctl status nginx --no-pager -l", "Checking Nginx status", FAST_CHECK_TIMEOUT),
+    ("ls -la /opt/trustlayer-ai/", "Checking TrustLayer AI directory", FAST_CHECK_TIMEOUT),
+    ("sudo ufw status", "Checking local firewall (ufw)", FAST_CHECK_TIMEOUT),
+]
+
+async def run_diagnostic_checks(vm_ip):
+    """Run all diagnostic checks at once and print their reports in order"""
+    # Set up the shared connection before the checks start, so they don't race to open it
+    multiplexed = vm_ip in _ssh_clients or await start_ssh_master(vm_ip)
+    tasks = [run_ssh_command(vm_ip, command, description, timeout if multiplexed else SLOW_CHECK_TIMEOUT)
+             for command, description, timeout in DIAGNOSTIC_CHECKS]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    for (command, description, timeout), result in zip(DIAGNOSTIC_CHECKS, results):
+        if isinstance(result, Exception):
+            print(f"🔍 {description}")
+            print(f"   ❌ Error: {result}")
+        else:
+            print("\n".join(result[2]))
+        print()
+    
+    return results
 
 def diagnose_vm(vm_ip):
     """Diagnose what's running on the VM"""
     print(f"🚀 Diagnosing TrustLayer AI VM: {vm_ip}")
     print("=" * 60)
     
-    # Check 1: What processes are listening on ports
-    run_ssh_command(vm_ip, "sudo netstat -tlnp | grep -E ':(80|8000|8501)\\s'", 
-                   "Checking what's listening on ports 80, 8000, 8501")
-    
-    print()
-    
-    # Check 2: Docker containers
-    run_ssh_command(vm_ip, "docker ps", 
-                   "Checking Docker containers")
-    
-    print()
-    
-    # Check 3: Docker compose status
-    run_ssh_command(vm_ip, "cd /opt/trustlayer-ai && docker-compose ps", 
-                   "Checking docker-compose status")
-    
-    print()
-    
-    # Check 4: Test local connectivity
-    run_ssh_command(vm_ip, "curl -s http://localhost:8000/health", 
-                   "Testing TrustLayer AI health locally")
-    
-    print()
-    
-    # Check 5: Test dashboard locally
-    run_ssh_command(vm_ip, "curl -I http://localhost:8501", 
-                   "Testing dashboard locally")
-    
-    print()
-    
-    # Check 6: Nginx status
-    run_ssh_command(vm_ip, "sudo systemctl status nginx --no-pager -l", 
-                   "Checking Nginx status")
-    
-    print()
-    
-    # Check 7: Check if TrustLayer directory exists
-    run_ssh_command(vm_ip, "ls -la /opt/trustlayer-ai/", 
-                   "Checking TrustLayer AI directory")
-    
-    print()
-    
-    # Check 8: Check firewall on VM
-    run_ssh_command(vm_ip, "sudo ufw status", 
-                   "Checking local firewall (ufw)")
+    connect_ssh_client(vm_ip)
+    asyncio.run(run_diagnostic_checks(vm_ip))
     
     print("=" * 60)
     print("🔧 DIAGNOSIS COMPLETE")
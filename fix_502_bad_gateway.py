@@ -4,22 +4,42 @@ Fix 502 Bad Gateway Error
 Diagnoses and fixes backend connectivity issues causing 502 errors
 """
 
+import asyncio
+import shlex
 import subprocess
 import sys
+import textwrap
 import time
+from itertools import islice
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
+import httpx
+
+from tl_fixops.containers import wait_healthy
+from tl_fixops.shell import install_file_sync as install_file
+
+TRUSTLAYER_DIR = "/opt/trustlayer-ai"
+
+PROXY_HEALTH_URL = "http://localhost:8000/health"
+DASHBOARD_URL = "http://localhost:8501"
+SERVICE_CONTAINERS = ["trustlayer-proxy", "trustlayer-dashboard"]
+NGINX_DASHBOARD_URL = "http://localhost/dashboard"
+NGINX_HEALTH_URL = "http://localhost/health"
+
+# One keep-alive client for every local HTTP probe instead of forking curl
+HTTP_CLIENT = httpx.Client(timeout=2)
+
+def run_command(argv, description="", cwd=None):
+    """Run command (an argv list, no shell) and return result"""
     print(f"🔧 {description}")
-    print(f"   Command: {command}")
+    print(f"   Command: {shlex.join(argv)}")
     
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        result = subprocess.run(argv, cwd=cwd, capture_output=True, text=True)
         if result.returncode == 0:
             print(f"   ✅ Success")
             if result.stdout.strip():
-                for line in result.stdout.strip().split('\n')[:3]:
-                    print(f"      {line}")
+                head = "\n".join(islice(result.stdout.strip().splitlines(), 3))
+                print(textwrap.indent(head, "      "))
             return True, result.stdout.strip()
         else:
             print(f"   ❌ Failed: {result.stderr.strip()}")
@@ -28,6 +48,78 @@ def run_command(command, description=""):
         print(f"   ❌ Error: {e}")
         return False, str(e)
 
+async def run_command_stream(argv, description="", cwd=None):
+    """Run command, echoing its output line by line as it arrives"""
+    print(f"🔧 {description}")
+    print(f"   Command: {shlex.join(argv)}")
+    
+    proc = await asyncio.create_subprocess_exec(
+        *argv, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+    async for line in proc.stdout:
+        print(f"      {line.decode(errors='replace').rstrip()}")
+    await proc.wait()
+    
+    if proc.returncode == 0:
+        print(f"   ✅ Success")
+    else:
+        print(f"   ❌ Failed (exit code {proc.returncode})")
+    return proc.returncode == 0
+
+def probe(url, description=""):
+    """GET url with the shared client and return (ok, status_code, body)"""
+    print(f"🔧 {description}")
+    print(f"   GET {url}")
+    
+    try:
+        response = HTTP_CLIENT.get(url)
+    except httpx.HTTPError as e:
+        print(f"   ❌ Error: {e}")
+        return False, None, ""
+    
+    if response.is_success:
+        print(f"   ✅ HTTP {response.status_code}")
+    else:
+        print(f"   ❌ HTTP {response.status_code}")
+    return response.is_success, response.status_code, response.text
+
+async def wait_ready(url, deadline):
+    """Poll url with exponential backoff until it responds or the deadline passes"""
+    backoff = 0.25
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(url, timeout=2)
+                if response.status_code < 500:
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 4.0)
+    return False
+
+async def wait_for_services(timeout=60):
+    """Wait for the containers to turn healthy, then confirm both endpoints"""
+    deadline = time.monotonic() + timeout
+    await wait_healthy(SERVICE_CONTAINERS, timeout)
+    return await asyncio.gather(
+        wait_ready(PROXY_HEALTH_URL, deadline),
+        wait_ready(DASHBOARD_URL, deadline)
+    )
+
+async def launch_services():
+    """Bring up the Docker services, then wait for the proxy and dashboard"""
+    await run_command_stream(["docker-compose", "up", "-d"], "Starting Docker services", cwd=TRUSTLAYER_DIR)
+    
+    print("   Waiting for services to become ready...")
+    return await wait_for_services()
+
+def start_services():
+    """Start the Docker services and wait until they respond"""
+    proxy_ready, dashboard_ready = asyncio.run(launch_services())
+    print(f"   Proxy: {'ready' if proxy_ready else 'not ready'}, "
+          f"Dashboard: {'ready' if dashboard_ready else 'not ready'}")
+    return proxy_ready and dashboard_ready
+
 def diagnose_502_error():
     """Diagnose the cause of 502 Bad Gateway errors"""
     print("🚀 Diagnosing 502 Bad Gateway Error")
@@ -36,54 +128,54 @@ def diagnose_502_error():
     print("\n1️⃣ Checking if services are running...")
     
     # Check Docker containers
-    success, output = run_command("docker ps", "Checking Docker containers")
+    success, output = run_command(["docker", "ps"], "Checking Docker containers")
     if success:
         if "trustlayer-dashboard" in output and "trustlayer-proxy" in output:
             print("   ✅ Both containers are running")
         else:
             print("   ❌ Some containers are missing")
             print("   Starting services...")
-            run_command("cd /opt/trustlayer-ai && docker-compose up -d", "Starting Docker services")
-            time.sleep(15)
+            start_services()
     
     print("\n2️⃣ Testing local connectivity...")
     
     # Test proxy locally
-    success, output = run_command("curl -s http://localhost:8000/health", "Testing proxy locally")
-    if success and "healthy" in output:
+    success, _, _ = probe(PROXY_HEALTH_URL, "Testing proxy locally")
+    if success:
         print("   ✅ Proxy is responding locally")
     else:
         print("   ❌ Proxy not responding locally")
         return False
     
     # Test dashboard locally
-    success, output = run_command("curl -I http://localhost:8501", "Testing dashboard locally")
-    if success and "200" in output:
+    _, status, _ = probe(DASHBOARD_URL, "Testing dashboard locally")
+    if status == 200:
         print("   ✅ Dashboard is responding locally")
     else:
         print("   ❌ Dashboard not responding locally")
         print("   Checking dashboard logs...")
-        run_command("docker logs trustlayer-dashboard --tail 10", "Dashboard logs")
+        run_command(["docker", "logs", "trustlayer-dashboard", "--tail", "10"], "Dashboard logs")
         return False
     
     print("\n3️⃣ Checking Nginx configuration...")
     
     # Test Nginx config
-    success, output = run_command("sudo nginx -t", "Testing Nginx config")
+    success, output = run_command(["sudo", "nginx", "-t"], "Testing Nginx config")
     if not success:
         print("   ❌ Nginx configuration has errors")
         return False
     
     # Check what Nginx is actually configured to do
-    run_command("sudo nginx -T | grep -A 5 -B 5 'location /dashboard'", "Checking dashboard location config")
+    run_command(["sh", "-c", "sudo nginx -T | grep -A 5 -B 5 'location /dashboard'"],
+                "Checking dashboard location config")
     
     print("\n4️⃣ Testing Nginx proxy...")
     
     # Test if Nginx can reach the backend
-    success, output = run_command("curl -I http://localhost/dashboard", "Testing Nginx proxy to dashboard")
-    if success and "200" in output:
+    _, status, _ = probe(NGINX_DASHBOARD_URL, "Testing Nginx proxy to dashboard")
+    if status == 200:
         print("   ✅ Nginx proxy working locally")
-    elif "502" in output:
+    elif status == 502:
         print("   ❌ Nginx getting 502 locally - backend connection issue")
         return False
     else:
@@ -97,8 +189,8 @@ def fix_502_error():
     print("=" * 40)
     
     print("\n1️⃣ Stopping all services...")
-    run_command("cd /opt/trustlayer-ai && docker-compose down", "Stopping Docker services")
-    run_command("sudo systemctl stop nginx", "Stopping Nginx")
+    run_command(["docker-compose", "down"], "Stopping Docker services", cwd=TRUSTLAYER_DIR)
+    run_command(["sudo", "systemctl", "stop", "nginx"], "Stopping Nginx")
     
     print("\n2️⃣ Creating working Nginx configuration...")
     
@@ -201,59 +293,49 @@ def fix_502_error():
 </html>'''
     
     # Install error page
-    run_command("sudo mkdir -p /var/www/html", "Creating web directory")
-    with open('/tmp/50x.html', 'w') as f:
-        f.write(error_page)
-    run_command("sudo cp /tmp/50x.html /var/www/html/50x.html", "Installing error page")
+    run_command(["sudo", "mkdir", "-p", "/var/www/html"], "Creating web directory")
+    install_file("/var/www/html/50x.html", error_page, "Installing error page")
     
     # Backup and install Nginx config
-    run_command("sudo cp /etc/nginx/sites-available/default /etc/nginx/sites-available/default.backup.502fix", 
+    run_command(["sudo", "cp", "/etc/nginx/sites-available/default", "/etc/nginx/sites-available/default.backup.502fix"], 
                "Backing up Nginx config")
     
-    with open('/tmp/nginx_502fix.conf', 'w') as f:
-        f.write(nginx_config)
-    
-    run_command("sudo cp /tmp/nginx_502fix.conf /etc/nginx/sites-available/default", 
-               "Installing new Nginx config")
+    install_file("/etc/nginx/sites-available/default", nginx_config, "Installing new Nginx config")
     
     print("\n3️⃣ Testing Nginx configuration...")
-    success, output = run_command("sudo nginx -t", "Testing Nginx config")
+    success, output = run_command(["sudo", "nginx", "-t"], "Testing Nginx config")
     if not success:
         print("   Restoring backup...")
-        run_command("sudo cp /etc/nginx/sites-available/default.backup.502fix /etc/nginx/sites-available/default", 
+        run_command(["sudo", "cp", "/etc/nginx/sites-available/default.backup.502fix", "/etc/nginx/sites-available/default"], 
                    "Restoring backup")
         return False
     
     print("\n4️⃣ Starting services in correct order...")
     
     # Start Docker services first
-    run_command("cd /opt/trustlayer-ai && docker-compose up -d", "Starting Docker services")
-    
-    print("   Waiting 20 seconds for services to fully start...")
-    time.sleep(20)
+    start_services()
     
     # Verify services are running
-    run_command("docker ps", "Checking Docker containers")
-    run_command("curl -s http://localhost:8000/health", "Testing proxy")
-    run_command("curl -I http://localhost:8501", "Testing dashboard")
+    probe(PROXY_HEALTH_URL, "Testing proxy")
+    probe(DASHBOARD_URL, "Testing dashboard")
     
-    # Start Nginx
-    run_command("sudo systemctl start nginx", "Starting Nginx")
+    # List containers and start Nginx in one process; systemctl returns once Nginx is up
+    run_command(["sh", "-c", "docker ps --format '{{.Names}} {{.Status}}'; sudo systemctl start nginx"],
+                "Checking Docker containers and starting Nginx")
     
     print("\n5️⃣ Testing the fix...")
-    time.sleep(5)
     
-    success, output = run_command("curl -I http://localhost/dashboard", "Testing dashboard via Nginx")
-    if success and "200" in output:
+    _, status, _ = probe(NGINX_DASHBOARD_URL, "Testing dashboard via Nginx")
+    if status == 200:
         print("   ✅ Dashboard working via Nginx!")
-    elif "502" in output:
+    elif status == 502:
         print("   ❌ Still getting 502 - backend issue")
         return False
     else:
         print("   ⚠️  Unexpected response")
     
-    success, output = run_command("curl -s http://localhost/health", "Testing health endpoint")
-    if success and "healthy" in output:
+    success, _, _ = probe(NGINX_HEALTH_URL, "Testing health endpoint")
+    if success:
         print("   ✅ Health endpoint working!")
     else:
         print("   ❌ Health endpoint not working")
@@ -300,10 +382,7 @@ def create_simple_error_page():
 </body>
 </html>'''
     
-    with open('/tmp/debug.html', 'w') as f:
-        f.write(debug_page)
-    
-    run_command("sudo cp /tmp/debug.html /var/www/html/debug.html", "Installing debug page")
+    install_file("/var/www/html/debug.html", debug_page, "Installing debug page")
     print("Debug page available at: /debug.html")
 
 def main():
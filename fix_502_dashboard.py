@@ -3,116 +3,91 @@
 Fix 502 Dashboard Error - Quick solution
 """
 
-import subprocess
-import sys
-import time
+import asyncio
+import gzip
+import json
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
-    print(f"🔧 {description}")
-    print(f"   Command: {command}")
-    
-    try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"   ✅ Success")
-            return True, result.stdout.strip()
-        else:
-            print(f"   ❌ Failed: {result.stderr.strip()}")
-            return False, result.stderr.strip()
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
-        return False, str(e)
+from tl_fixops.containers import wait_healthy
+from tl_fixops.nginx import reload_nginx, render_config
+from tl_fixops.probes import probe, wait_ready
+from tl_fixops.shell import ensure_root, install_file, run_async as run_command
+
+TRUSTLAYER_DIR = "/opt/trustlayer-ai"
+
+# Parsed `docker ps` output, reused until compose changes the container set
+_containers = None
 
-def fix_502_dashboard():
+async def list_containers(refresh=False):
+    """Return running containers keyed by name from one cached `docker ps`"""
+    global _containers
+    if _containers is None or refresh:
+        success, output = await run_command(
+            ["docker", "ps", "--no-trunc", "--format", "{{json .}}"], "Checking containers",
+            keep_lines=None)
+        containers = [json.loads(line) for line in output.splitlines()] if success else []
+        _containers = {c["Names"]: c for c in containers}
+    return _containers
+
+async def fix_502_dashboard():
     """Fix 502 Bad Gateway for dashboard"""
     print("🚀 Fixing 502 Bad Gateway for Dashboard")
     print("=" * 40)
     
     print("\n1️⃣ Checking service status...")
-    run_command("docker ps", "Checking containers")
-    run_command("docker logs trustlayer-dashboard --tail 10", "Dashboard logs")
+    containers, _ = await asyncio.gather(
+        list_containers(),
+        run_command("docker logs trustlayer-dashboard --tail 10", "Dashboard logs")
+    )
+    for name, container in containers.items():
+        print(f"   {name}: {container['Status']}")
     
     print("\n2️⃣ Testing local connectivity...")
-    success, _ = run_command("curl -I http://localhost:8501", "Testing dashboard locally")
+    if "trustlayer-dashboard" in containers:
+        success, _ = await probe("http://localhost:8501", "Testing dashboard locally")
+    else:
+        print("   ❌ trustlayer-dashboard container is not running")
+        success = False
     
     if not success:
-        print("   Dashboard not responding locally - restarting services...")
+        print("   Dashboard not responding locally - recreating dashboard container...")
         
-        # Stop and restart services
-        run_command("cd /opt/trustlayer-ai && docker-compose down", "Stopping services")
-        time.sleep(5)
-        run_command("cd /opt/trustlayer-ai && docker-compose up -d", "Starting services")
+        # Only the dashboard is recreated; proxy and redis keep running
+        await run_command(["docker-compose", "up", "-d", "--no-deps", "--force-recreate", "dashboard"],
+                          "Recreating dashboard", cwd=TRUSTLAYER_DIR)
         
-        print("   Waiting 30 seconds for services to start...")
-        time.sleep(30)
+        print("   Waiting for the dashboard to report healthy...")
+        await wait_healthy(["trustlayer-dashboard"])
+        await list_containers(refresh=True)
         
         # Test again
-        success, _ = run_command("curl -I http://localhost:8501", "Re-testing dashboard")
+        success, _ = await probe("http://localhost:8501", "Re-testing dashboard")
         
         if not success:
             print("   ❌ Dashboard still not working - creating simple solution...")
-            create_simple_solution()
+            await create_simple_solution()
             return
     
     print("\n3️⃣ Fixing Nginx configuration...")
     
     # Simple working Nginx config
-    nginx_config = '''server {
-    listen 80 default_server;
-    server_name _;
-    
-    # Main proxy
-    location / {
-        proxy_pass http://127.0.0.1:8000;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-    }
-    
-    # Dashboard - direct proxy
-    location /dashboard {
-        proxy_pass http://127.0.0.1:8501/;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        
-        # WebSocket support
-        proxy_http_version 1.1;
-        proxy_set_header Upgrade $http_upgrade;
-        proxy_set_header Connection "upgrade";
-        proxy_buffering off;
-    }
-    
-    # Favicon
-    location /favicon.ico {
-        return 204;
-        access_log off;
-        log_not_found off;
-    }
-}'''
+    await install_file("/etc/nginx/sites-available/default", render_config("proxy", favicon=True),
+                       "Installing simple Nginx config")
     
-    with open('/tmp/nginx_simple.conf', 'w') as f:
-        f.write(nginx_config)
-    
-    run_command("sudo cp /tmp/nginx_simple.conf /etc/nginx/sites-available/default", 
-               "Installing simple Nginx config")
-    
-    run_command("sudo nginx -t", "Testing Nginx config")
-    run_command("sudo systemctl restart nginx", "Restarting Nginx")
+    await run_command("nginx -t", "Testing Nginx config")
+    await reload_nginx()
     
     print("\n4️⃣ Testing the fix...")
-    time.sleep(5)
+    await wait_ready("http://localhost/dashboard", timeout=10)
     
-    success, _ = run_command("curl -I http://localhost/dashboard", "Testing dashboard via Nginx")
+    success, _ = await probe("http://localhost/dashboard", "Testing dashboard via Nginx")
     
     if success:
         print("   ✅ Dashboard working!")
     else:
         print("   ❌ Still not working - using alternative solution...")
-        create_simple_solution()
+        await create_simple_solution()
 
-def create_simple_solution():
+async def create_simple_solution():
     """Create simple HTML page that works"""
     print("\n🔧 Creating Simple HTML Solution")
     print("=" * 35)
@@ -217,57 +192,26 @@ def create_simple_solution():
 </body>
 </html>'''
     
-    # Create the HTML file
-    with open('/tmp/simple_dashboard.html', 'w') as f:
-        f.write(simple_html)
-    
-    # Create web directory and copy file
-    run_command("sudo mkdir -p /var/www/html", "Creating web directory")
-    run_command("sudo cp /tmp/simple_dashboard.html /var/www/html/dashboard.html", "Installing simple dashboard")
+    # Create web directory and install the page
+    await run_command("mkdir -p /var/www/html", "Creating web directory")
+    await install_file("/var/www/html/dashboard.html", simple_html, "Installing simple dashboard")
+    # Precompressed copy for gzip_static, so Nginx never gzips the page per request
+    await install_file("/var/www/html/dashboard.html.gz", gzip.compress(simple_html.encode(), 9, mtime=0),
+                       "Installing precompressed dashboard")
     
     # Update Nginx to serve the HTML file
-    nginx_html_config = '''server {
-    listen 80 default_server;
-    server_name _;
-    
-    root /var/www/html;
-    index dashboard.html;
-    
-    # Main proxy
-    location / {
-        proxy_pass http://127.0.0.1:8000;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-    }
-    
-    # Dashboard - serve HTML file
-    location /dashboard {
-        try_files /dashboard.html =404;
-    }
-    
-    # Favicon
-    location /favicon.ico {
-        return 204;
-        access_log off;
-        log_not_found off;
-    }
-}'''
-    
-    with open('/tmp/nginx_html.conf', 'w') as f:
-        f.write(nginx_html_config)
-    
-    run_command("sudo cp /tmp/nginx_html.conf /etc/nginx/sites-available/default", 
-               "Installing HTML Nginx config")
+    await install_file("/etc/nginx/sites-available/default", render_config("html", favicon=True),
+                       "Installing HTML Nginx config")
     
-    run_command("sudo nginx -t", "Testing Nginx config")
-    run_command("sudo systemctl restart nginx", "Restarting Nginx")
+    await run_command("nginx -t", "Testing Nginx config")
+    await reload_nginx()
     
     print("   ✅ Simple HTML dashboard created!")
 
 def main():
     """Main function"""
-    fix_502_dashboard()
+    ensure_root()
+    asyncio.run(fix_502_dashboard())
     
     print("\n" + "=" * 50)
     print("🎉 502 DASHBOARD FIX COMPLETE!")
@@ -3,40 +3,25 @@
 Final Dashboard Fix - Complete solution for static file and MIME type issues
 """
 
-import subprocess
-import sys
-import time
+import asyncio
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
-    print(f"🔧 {description}")
-    print(f"   Command: {command}")
-    
-    try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"   ✅ Success")
-            if result.stdout.strip():
-                for line in result.stdout.strip().split('\n')[:2]:
-                    print(f"      {line}")
-            return True, result.stdout.strip()
-        else:
-            print(f"   ❌ Failed: {result.stderr.strip()}")
-            return False, result.stderr.strip()
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
-        return False, str(e)
+from tl_fixops.containers import wait_healthy
+from tl_fixops.nginx import reload_nginx, render_config
+from tl_fixops.probes import probe_urls
+from tl_fixops.shell import ensure_root, install_file, run_async as run_command
 
-def final_dashboard_fix():
+TRUSTLAYER_DIR = "/opt/trustlayer-ai"
+
+async def final_dashboard_fix():
     """Apply final comprehensive fix for dashboard"""
     print("🚀 Applying Final Dashboard Fix")
     print("=" * 50)
     
-    print("\n1️⃣ Stopping services...")
-    run_command("cd /opt/trustlayer-ai && docker-compose down", "Stopping Docker services")
+    print("\n1️⃣ Stopping dashboard...")
+    await run_command(["docker-compose", "stop", "dashboard"], "Stopping dashboard container", cwd=TRUSTLAYER_DIR)
     
     print("\n2️⃣ Creating Streamlit config directory...")
-    run_command("mkdir -p /opt/trustlayer-ai/.streamlit", "Creating config directory")
+    await run_command("mkdir -p /opt/trustlayer-ai/.streamlit", "Creating config directory")
     
     print("\n3️⃣ Installing Streamlit configuration...")
     streamlit_config = '''[server]
@@ -69,74 +54,37 @@ level = "info"
 developmentMode = false
 '''
     
-    with open('/tmp/streamlit_config.toml', 'w') as f:
-        f.write(streamlit_config)
-    
-    run_command("sudo cp /tmp/streamlit_config.toml /opt/trustlayer-ai/.streamlit/config.toml", 
-               "Installing Streamlit config")
+    await install_file("/opt/trustlayer-ai/.streamlit/config.toml", streamlit_config, "Installing Streamlit config")
     
     print("\n4️⃣ Creating working Nginx configuration...")
     
-    nginx_config = '''server {
-    listen 80 default_server;
-    listen [::]:80 default_server;
-    server_name _;
-    
-    # Main TrustLayer AI Proxy
-    location / {
-        proxy_pass http://127.0.0.1:8000;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-        
-        proxy_connect_timeout 60s;
-        proxy_send_timeout 60s;
-        proxy_read_timeout 60s;
-        client_max_body_size 10M;
-    }
-    
-    # Dashboard redirect - simple solution
-    location = /dashboard {
-        return 301 $scheme://$host:8501/;
-    }
-    
-    # Alternative dashboard path
-    location /dashboard/ {
-        return 301 $scheme://$host:8501/;
-    }
-}'''
-    
-    with open('/tmp/nginx_final.conf', 'w') as f:
-        f.write(nginx_config)
-    
     # Backup and install
-    run_command("sudo cp /etc/nginx/sites-available/default /etc/nginx/sites-available/default.backup.final", 
-               "Backing up Nginx config")
+    await run_command("cp /etc/nginx/sites-available/default /etc/nginx/sites-available/default.backup.final", 
+                     "Backing up Nginx config")
     
-    run_command("sudo cp /tmp/nginx_final.conf /etc/nginx/sites-available/default", 
-               "Installing final Nginx config")
+    config = render_config("redirect", ipv6=True, proxy_tuning=True)
+    await install_file("/etc/nginx/sites-available/default", config, "Installing final Nginx config")
     
     print("\n5️⃣ Testing and restarting services...")
     
-    success, _ = run_command("sudo nginx -t", "Testing Nginx config")
+    success, _ = await run_command("nginx -t", "Testing Nginx config")
     if not success:
         print("   Restoring backup...")
-        run_command("sudo cp /etc/nginx/sites-available/default.backup.final /etc/nginx/sites-available/default", 
-                   "Restoring backup")
+        await run_command("cp /etc/nginx/sites-available/default.backup.final /etc/nginx/sites-available/default", 
+                         "Restoring backup")
         return False
     
-    run_command("sudo systemctl restart nginx", "Restarting Nginx")
+    await reload_nginx()
     
-    print("\n6️⃣ Starting Docker services with new config...")
-    run_command("cd /opt/trustlayer-ai && docker-compose up -d", "Starting services")
+    print("\n6️⃣ Recreating dashboard with new config...")
+    await run_command(["docker-compose", "up", "-d", "--no-deps", "--force-recreate", "dashboard"],
+                      "Recreating dashboard", cwd=TRUSTLAYER_DIR)
     
-    print("\n7️⃣ Waiting for services to start...")
-    time.sleep(20)
+    print("\n7️⃣ Waiting for dashboard to start...")
+    await wait_healthy(["trustlayer-dashboard"])
     
     print("\n8️⃣ Testing access...")
-    run_command("curl -I http://localhost:8501", "Testing direct dashboard access")
-    run_command("curl -I http://localhost/dashboard", "Testing dashboard redirect")
+    await probe_urls(["http://localhost:8501", "http://localhost/dashboard"])
     
     print("\n" + "=" * 50)
     print("🎉 FINAL DASHBOARD FIX COMPLETE!")
@@ -153,7 +101,7 @@ developmentMode = false
     
     return True
 
-def create_minimal_dashboard():
+async def create_minimal_dashboard():
     """Create a minimal dashboard that works without static files"""
     print("\n🔧 Creating Minimal Dashboard (No Static Files)")
     print("=" * 50)
@@ -258,17 +206,14 @@ if __name__ == "__main__":
     main()
 '''
     
-    with open('/tmp/minimal_dashboard.py', 'w') as f:
-        f.write(minimal_dashboard)
-    
-    run_command("sudo cp /tmp/minimal_dashboard.py /opt/trustlayer-ai/minimal_dashboard.py", 
-               "Installing minimal dashboard")
+    await install_file("/opt/trustlayer-ai/minimal_dashboard.py", minimal_dashboard, "Installing minimal dashboard")
     
     print("✅ Minimal dashboard created!")
     print("To use it, update docker-compose.yml to run minimal_dashboard.py instead")
 
 def main():
     """Main function"""
+    ensure_root()
     print("TrustLayer AI Dashboard Final Fix")
     print("Choose your approach:")
     print("1. Apply comprehensive fix (recommended)")
@@ -278,7 +223,7 @@ def main():
     choice = input("Enter choice (1-3): ").strip()
     
     if choice == "1":
-        success = final_dashboard_fix()
+        success = asyncio.run(final_dashboard_fix())
         if success:
             print("\n✅ Fix applied! Try these URLs:")
             print("- https://trustlayer.asolvitra.tech:8501 (direct)")
@@ -287,7 +232,7 @@ def main():
             print("\n❌ Fix failed")
     
     elif choice == "2":
-        create_minimal_dashboard()
+        asyncio.run(create_minimal_dashboard())
         print("\n✅ Minimal dashboard created!")
         print("Update docker-compose.yml to use minimal_dashboard.py")
     
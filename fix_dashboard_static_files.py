@@ -4,189 +4,52 @@ Fix Dashboard Static Files
 Fixes Nginx configuration to properly serve Streamlit dashboard static files
 """
 
-import subprocess
-import sys
+import asyncio
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
-    print(f"🔧 {description}")
-    print(f"   Command: {command}")
-    
-    try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"   ✅ Success")
-            if result.stdout.strip():
-                for line in result.stdout.strip().split('\n')[:3]:
-                    print(f"      {line}")
-            return True, result.stdout.strip()
-        else:
-            print(f"   ❌ Failed: {result.stderr.strip()}")
-            return False, result.stderr.strip()
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
-        return False, str(e)
+from tl_fixops.nginx import reload_nginx, render_config
+from tl_fixops.probes import probe_urls
+from tl_fixops.shell import ensure_root, install_file, run_async as run_command
 
-def fix_nginx_for_dashboard():
+async def fix_nginx_for_dashboard():
     """Fix Nginx configuration for Streamlit dashboard static files"""
     print("🚀 Fixing Nginx Configuration for Dashboard Static Files")
     print("=" * 60)
     
     # Create improved Nginx configuration
-    nginx_config = '''server {
-    listen 80 default_server;
-    listen [::]:80 default_server;
-    server_name _;
-    
-    # Main TrustLayer AI Proxy
-    location / {
-        proxy_pass http://127.0.0.1:8000;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-        
-        # Handle timeouts
-        proxy_connect_timeout 60s;
-        proxy_send_timeout 60s;
-        proxy_read_timeout 60s;
-        
-        # Handle large requests
-        client_max_body_size 10M;
-    }
-    
-    # Dashboard - Main application
-    location /dashboard {
-        rewrite ^/dashboard(.*) /$1 break;
-        proxy_pass http://127.0.0.1:8501;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-        
-        # WebSocket support for Streamlit
-        proxy_http_version 1.1;
-        proxy_set_header Upgrade $http_upgrade;
-        proxy_set_header Connection "upgrade";
-        
-        # Important: Don't buffer responses for Streamlit
-        proxy_buffering off;
-        proxy_cache off;
-    }
-    
-    # Dashboard static files - CSS, JS, fonts, images
-    location /dashboard/static/ {
-        rewrite ^/dashboard/static/(.*) /static/$1 break;
-        proxy_pass http://127.0.0.1:8501;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        
-        # Set correct MIME types for static files
-        location ~* \\.css$ {
-            proxy_pass http://127.0.0.1:8501;
-            add_header Content-Type text/css;
-        }
-        
-        location ~* \\.js$ {
-            proxy_pass http://127.0.0.1:8501;
-            add_header Content-Type application/javascript;
-        }
-        
-        location ~* \\.(woff|woff2|ttf|eot)$ {
-            proxy_pass http://127.0.0.1:8501;
-            add_header Content-Type font/woff2;
-        }
-        
-        location ~* \\.(png|jpg|jpeg|gif|ico|svg)$ {
-            proxy_pass http://127.0.0.1:8501;
-            add_header Content-Type image/png;
-        }
-        
-        # Cache static files
-        expires 1d;
-        add_header Cache-Control "public, immutable";
-    }
-    
-    # Dashboard WebSocket endpoint
-    location /dashboard/stream {
-        rewrite ^/dashboard/stream(.*) /stream$1 break;
-        proxy_pass http://127.0.0.1:8501;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        
-        # WebSocket specific headers
-        proxy_http_version 1.1;
-        proxy_set_header Upgrade $http_upgrade;
-        proxy_set_header Connection "upgrade";
-        proxy_read_timeout 86400;
-    }
-    
-    # Health check endpoint
-    location /health {
-        proxy_pass http://127.0.0.1:8000/health;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-    }
-    
-    # Metrics endpoint
-    location /metrics {
-        proxy_pass http://127.0.0.1:8000/metrics;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-    }
-    
-    # Test endpoint
-    location /test {
-        proxy_pass http://127.0.0.1:8000/test;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-    }
-}'''
-    
     print("\n1️⃣ Backing up current Nginx configuration...")
-    run_command("sudo cp /etc/nginx/sites-available/default /etc/nginx/sites-available/default.backup.$(date +%Y%m%d_%H%M%S)", 
-               "Creating timestamped backup")
+    await run_command("cp /etc/nginx/sites-available/default /etc/nginx/sites-available/default.backup.$(date +%Y%m%d_%H%M%S)", 
+                     "Creating timestamped backup")
     
     print("\n2️⃣ Creating improved Nginx configuration...")
-    # Write config to temporary file
-    with open('/tmp/nginx_dashboard_fix.conf', 'w') as f:
-        f.write(nginx_config)
-    
-    # Copy to Nginx sites-available
-    run_command("sudo cp /tmp/nginx_dashboard_fix.conf /etc/nginx/sites-available/default", 
-               "Installing improved Nginx config")
+    # Install into Nginx sites-available
+    config = render_config("rewrite", ipv6=True, proxy_tuning=True, static_files=True)
+    await install_file("/etc/nginx/sites-available/default", config, "Installing improved Nginx config")
     
     print("\n3️⃣ Testing Nginx configuration...")
-    success, output = run_command("sudo nginx -t", "Testing Nginx config syntax")
+    success, output = await run_command("nginx -t", "Testing Nginx config syntax")
     
     if not success:
         print("   ❌ Nginx configuration has errors")
         print("   Restoring backup...")
-        run_command("sudo cp /etc/nginx/sites-available/default.backup.* /etc/nginx/sites-available/default", 
-                   "Restoring backup")
+        await run_command("cp /etc/nginx/sites-available/default.backup.* /etc/nginx/sites-available/default", 
+                         "Restoring backup")
         return False
     
-    print("\n4️⃣ Restarting Nginx...")
-    run_command("sudo systemctl restart nginx", "Restarting Nginx service")
+    print("\n4️⃣ Reloading Nginx...")
+    await reload_nginx()
     
-    print("\n5️⃣ Testing dashboard access...")
-    success, output = run_command("curl -I http://localhost/dashboard", "Testing dashboard access")
+    print("\n5️⃣ Testing dashboard and static file access...")
+    statuses = await probe_urls([
+        "http://localhost/dashboard",
+        "http://localhost/dashboard/static/css/main.77d1c464.css",
+        "http://localhost/dashboard/static/js/main.d090770a.js",
+    ])
     
-    if success and "200" in output:
+    if statuses["http://localhost/dashboard"] == 200:
         print("   ✅ Dashboard accessible")
     else:
         print("   ⚠️  Dashboard may have issues")
     
-    print("\n6️⃣ Testing static file access...")
-    run_command("curl -I http://localhost/dashboard/static/css/main.77d1c464.css", "Testing CSS file")
-    run_command("curl -I http://localhost/dashboard/static/js/main.d090770a.js", "Testing JS file")
-    
     print("\n" + "=" * 60)
     print("🎉 NGINX DASHBOARD FIX COMPLETE!")
     print("=" * 60)
@@ -198,38 +61,17 @@ def fix_nginx_for_dashboard():
     
     return True
 
-def alternative_simple_fix():
+async def alternative_simple_fix():
     """Alternative simple fix - direct proxy to dashboard"""
     print("\n🔧 ALTERNATIVE SIMPLE FIX")
     print("=" * 40)
     
-    simple_config = '''server {
-    listen 80 default_server;
-    server_name _;
-    
-    # Main proxy
-    location / {
-        proxy_pass http://127.0.0.1:8000;
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-    }
-    
-    # Dashboard - simple direct proxy
-    location /dashboard {
-        return 301 http://$host:8501/;
-    }
-}'''
-    
     print("Creating simple configuration that redirects /dashboard to port 8501...")
     
-    with open('/tmp/nginx_simple.conf', 'w') as f:
-        f.write(simple_config)
-    
-    run_command("sudo cp /tmp/nginx_simple.conf /etc/nginx/sites-available/default", 
-               "Installing simple config")
-    run_command("sudo nginx -t", "Testing simple config")
-    run_command("sudo systemctl restart nginx", "Restarting Nginx")
+    await install_file("/etc/nginx/sites-available/default", render_config("redirect"),
+                       "Installing simple config")
+    await run_command("nginx -t", "Testing simple config")
+    await reload_nginx()
     
     print("\nWith this config, use:")
     print("- Main proxy: https://trustlayer.asolvitra.tech")
@@ -237,6 +79,7 @@ def alternative_simple_fix():
 
 def main():
     """Main function"""
+    ensure_root()
     print("Choose fix method:")
     print("1. Advanced fix (recommended) - Fixes static file serving")
     print("2. Simple fix - Redirect to port 8501")
@@ -245,15 +88,15 @@ def main():
     choice = input("Enter choice (1-3): ").strip()
     
     if choice == "1":
-        success = fix_nginx_for_dashboard()
+        success = asyncio.run(fix_nginx_for_dashboard())
     elif choice == "2":
-        alternative_simple_fix()
+        asyncio.run(alternative_simple_fix())
         success = True
     else:  # choice == "3" or default
-        success = fix_nginx_for_dashboard()
+        success = asyncio.run(fix_nginx_for_dashboard())
         if not success:
             print("\n⚠️  Advanced fix failed, trying simple fix...")
-            alternative_simple_fix()
+            asyncio.run(alternative_simple_fix())
     
     if success:
         print("\n✅ Configuration updated!")
@@ -4,60 +4,27 @@ Fix Exit Code 127 - Command Not Found Error
 Fixes Docker container startup issues when commands are not found
 """
 
+import argparse
+import shlex
 import subprocess
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
-    print(f"🔧 {description}")
-    print(f"   Command: {command}")
-    
-    try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"   ✅ Success")
-            if result.stdout.strip():
-                for line in result.stdout.strip().split('\n')[:3]:
-                    print(f"      {line}")
-            return True, result.stdout.strip()
-        else:
-            print(f"   ❌ Failed: {result.stderr.strip()}")
-            return False, result.stderr.strip()
-    except Exception as e:
-        print(f"   ❌ Error: {e}")
-        return False, str(e)
+import requests
+from requests.adapters import HTTPAdapter
 
-def fix_exit_code_127():
-    """Fix exit code 127 (command not found) error"""
-    print("🚀 Fixing Exit Code 127 - Command Not Found")
-    print("=" * 50)
-    
-    print("\n1️⃣ Checking current Docker setup...")
-    
-    # Check Docker logs for more details
-    run_command("docker logs trustlayer-proxy --tail 20", "Checking proxy logs")
-    run_command("docker logs trustlayer-dashboard --tail 20", "Checking dashboard logs")
-    
-    print("\n2️⃣ Stopping and cleaning up containers...")
-    run_command("cd /opt/trustlayer-ai && docker-compose down", "Stopping containers")
-    run_command("docker system prune -f", "Cleaning up Docker")
-    
-    print("\n3️⃣ Checking Dockerfile...")
-    
-    # Read current Dockerfile
-    try:
-        with open('/opt/trustlayer-ai/Dockerfile', 'r') as f:
-            dockerfile_content = f.read()
-        print("   ✅ Dockerfile found")
-    except FileNotFoundError:
-        print("   ❌ Dockerfile not found - creating new one")
-        dockerfile_content = ""
-    
-    print("\n4️⃣ Creating working Dockerfile...")
-    
-    # Create a working Dockerfile
-    dockerfile = '''FROM python:3.11-slim
+from tl_fixops.shell import install_file_sync as install_file
+
+# One keep-alive session for every local HTTP probe instead of forking curl
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=10))
+
+TRUSTLAYER_DIR = "/opt/trustlayer-ai"
+
+# Working Dockerfile installed by fix_exit_code_127()
+DOCKERFILE_TEMPLATE = '''FROM python:3.11-slim
 
 # Set working directory
 WORKDIR /app
@@ -92,16 +59,9 @@ EXPOSE 8000 8501
 # Default command (can be overridden in docker-compose)
 CMD ["python", "-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000"]
 '''
-    
-    with open('/tmp/Dockerfile.fixed', 'w') as f:
-        f.write(dockerfile)
-    
-    run_command("sudo cp /tmp/Dockerfile.fixed /opt/trustlayer-ai/Dockerfile", "Installing fixed Dockerfile")
-    
-    print("\n5️⃣ Creating working docker-compose.yml...")
-    
-    # Create a working docker-compose.yml
-    docker_compose = '''version: '3.8'
+
+# Working docker-compose.yml installed by fix_exit_code_127()
+COMPOSE_TEMPLATE = '''version: '3.8'
 
 services:
   proxy:
@@ -118,9 +78,9 @@ services:
     command: ["python", "-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000", "--reload"]
     healthcheck:
       test: ["CMD", "curl", "-f", "http://localhost:8000/health"]
-      interval: 30s
-      timeout: 10s
-      retries: 3
+      interval: 5s
+      timeout: 5s
+      retries: 12
 
   dashboard:
     build: .
@@ -135,9 +95,9 @@ services:
     command: ["python", "-m", "streamlit", "run", "dashboard.py", "--server.port=8501", "--server.address=0.0.0.0", "--server.headless=true"]
     healthcheck:
       test: ["CMD", "curl", "-f", "http://localhost:8501"]
-      interval: 30s
-      timeout: 10s
-      retries: 3
+      interval: 5s
+      timeout: 5s
+      retries: 12
 
   redis:
     image: redis:7-alpine
@@ -151,44 +111,9 @@ services:
       timeout: 10s
       retries: 3
 '''
-    
-    with open('/tmp/docker-compose.fixed.yml', 'w') as f:
-        f.write(docker_compose)
-    
-    run_command("sudo cp /tmp/docker-compose.fixed.yml /opt/trustlayer-ai/docker-compose.yml", 
-               "Installing fixed docker-compose")
-    
-    print("\n6️⃣ Rebuilding Docker images...")
-    run_command("cd /opt/trustlayer-ai && docker-compose build --no-cache", "Rebuilding images")
-    
-    print("\n7️⃣ Starting services...")
-    run_command("cd /opt/trustlayer-ai && docker-compose up -d", "Starting services")
-    
-    print("\n8️⃣ Waiting for services to start...")
-    time.sleep(30)
-    
-    print("\n9️⃣ Checking service status...")
-    run_command("docker ps", "Checking running containers")
-    run_command("docker logs trustlayer-proxy --tail 10", "Checking proxy logs")
-    run_command("docker logs trustlayer-dashboard --tail 10", "Checking dashboard logs")
-    
-    print("\n🔟 Testing services...")
-    run_command("curl -s http://localhost:8000/health", "Testing proxy health")
-    run_command("curl -I http://localhost:8501", "Testing dashboard")
-    
-    print("\n" + "=" * 50)
-    print("🎉 EXIT CODE 127 FIX COMPLETE!")
-    print("=" * 50)
-    
-    return True
 
-def create_minimal_setup():
-    """Create minimal setup that definitely works"""
-    print("\n🔧 Creating Minimal Working Setup")
-    print("=" * 40)
-    
-    # Minimal Dockerfile
-    minimal_dockerfile = '''FROM python:3.11-slim
+# Minimal Dockerfile installed by create_minimal_setup()
+MINIMAL_DOCKERFILE_TEMPLATE = '''FROM python:3.11-slim
 
 WORKDIR /app
 
@@ -201,9 +126,9 @@ COPY . .
 # Simple startup
 CMD ["python", "-c", "print('Container started successfully')"]
 '''
-    
-    # Minimal docker-compose
-    minimal_compose = '''version: '3.8'
+
+# Minimal docker-compose.yml installed by create_minimal_setup()
+MINIMAL_COMPOSE_TEMPLATE = '''version: '3.8'
 
 services:
   proxy:
@@ -212,6 +137,11 @@ services:
       - "8000:8000"
     container_name: trustlayer-proxy
     command: ["python", "-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000"]
+    healthcheck:
+      test: ["CMD", "python", "-c", "import urllib.request; urllib.request.urlopen('http://localhost:8000/health')"]
+      interval: 5s
+      timeout: 5s
+      retries: 12
     
   dashboard:
     build: .
@@ -219,16 +149,216 @@ services:
       - "8501:8501"
     container_name: trustlayer-dashboard
     command: ["python", "-m", "streamlit", "run", "dashboard.py", "--server.port=8501", "--server.address=0.0.0.0"]
+    healthcheck:
+      test: ["CMD", "python", "-c", "import urllib.request; urllib.request.urlopen('http://localhost:8501/_stcore/health')"]
+      interval: 5s
+      timeout: 5s
+      retries: 12
 '''
+
+def run_command(argv, description="", cwd=None, use_shell=False):
+    """Run command (an argv list; a string only with use_shell=True) and return result"""
+    print(f"🔧 {description}")
+    print(f"   Command: {argv if use_shell else shlex.join(argv)}")
     
-    with open('/tmp/Dockerfile.minimal', 'w') as f:
-        f.write(minimal_dockerfile)
+    try:
+        result = subprocess.run(argv, shell=use_shell, cwd=cwd, capture_output=True, text=True)
+        if result.returncode == 0:
+            print(f"   ✅ Success")
+            if result.stdout.strip():
+                for line in islice(result.stdout.strip().splitlines(), 3):
+                    print(f"      {line}")
+            return True, result.stdout.strip()
+        else:
+            print(f"   ❌ Failed: {result.stderr.strip()}")
+            return False, result.stderr.strip()
+    except Exception as e:
+        print(f"   ❌ Error: {e}")
+        return False, str(e)
+
+def run_streaming(argv, description="", cwd=None):
+    """Run a long-running command, echoing its output as it arrives; return True on success"""
+    print(f"🔧 {description}")
+    print(f"   Command: {shlex.join(argv)}")
+    
+    try:
+        proc = subprocess.Popen(argv, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                bufsize=1, text=True)
+        for line in proc.stdout:
+            print(f"      {line}", end="")
+        returncode = proc.wait()
+    except Exception as e:
+        print(f"   ❌ Error: {e}")
+        return False
+    
+    if returncode == 0:
+        print(f"   ✅ Success")
+        return True
+    print(f"   ❌ Failed with exit code {returncode}")
+    return False
+
+def probe(url, description=""):
+    """GET url with the shared session and return (ok, status_code)"""
+    print(f"🔧 {description}")
+    print(f"   GET {url}")
+    
+    try:
+        response = SESSION.get(url, timeout=5)
+    except requests.exceptions.RequestException as e:
+        print(f"   ❌ Error: {e}")
+        return False, None
+    
+    if response.status_code == 200:
+        print(f"   ✅ HTTP {response.status_code}")
+    else:
+        print(f"   ❌ HTTP {response.status_code}")
+    return response.status_code == 200, response.status_code
+
+def wait_for(url, attempts=10, max_interval=10.0):
+    """Poll url in-process with the shared session and exponential backoff until it answers OK"""
+    for attempt in range(attempts):
+        try:
+            if SESSION.get(url, timeout=2).ok:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        if attempt < attempts - 1:
+            time.sleep(min(max_interval, 0.25 * 2 ** attempt))
+    return False
+
+def wait_healthy(container, timeout=90):
+    """Poll the container's Docker health status with exponential backoff, return the final status"""
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while time.monotonic() < deadline:
+        result = subprocess.run(
+            ["docker", "inspect", "--format",
+             "{{if .State.Health}}{{.State.Health.Status}}{{else}}none{{end}}", container],
+            capture_output=True, text=True)
+        status = result.stdout.strip()
+        if status in ("healthy", "unhealthy", "none"):
+            return status
+        time.sleep(min(2.0, 0.05 * 2 ** attempt))
+        attempt += 1
+    return "timeout"
+
+def wait_until_ready(container, url):
+    """Wait on the Docker healthcheck, falling back to HTTP polling when there is none"""
+    status = wait_healthy(container)
+    if status == "none":
+        return wait_for(url)
+    return status == "healthy"
+
+def container_status(*containers):
+    """One docker inspect for several containers, returning {name: (state, health)}"""
+    result = subprocess.run(
+        ["docker", "inspect", "--format",
+         "{{.Name}} {{.State.Status}} {{if .State.Health}}{{.State.Health.Status}}{{else}}none{{end}}",
+         *containers],
+        capture_output=True, text=True)
+    statuses = {}
+    for line in result.stdout.splitlines():
+        name, state, health = line.split()
+        statuses[name.lstrip("/")] = (state, health)
+    return statuses
+
+def report_containers(tail):
+    """Print container states and recent compose logs in two daemon round-trips"""
+    statuses = container_status("trustlayer-proxy", "trustlayer-dashboard", "trustlayer-redis")
+    for name in ("trustlayer-proxy", "trustlayer-dashboard", "trustlayer-redis"):
+        state, health = statuses.get(name, ("missing", "none"))
+        icon = "✅" if state == "running" and health in ("healthy", "none") else "⚠️ "
+        print(f"   {icon} {name}: {state} (health: {health})")
+    run_command(["docker-compose", "logs", "--no-color", "--tail", str(tail)],
+               "Checking service logs", cwd=TRUSTLAYER_DIR)
+
+def wait_for_services():
+    """Wait for proxy and dashboard concurrently, returning once both are up (or given up)"""
+    checks = {
+        "Proxy": ("trustlayer-proxy", "http://localhost:8000/health"),
+        "Dashboard": ("trustlayer-dashboard", "http://localhost:8501"),
+    }
+    with ThreadPoolExecutor(max_workers=len(checks)) as pool:
+        futures = {pool.submit(wait_until_ready, *args): name for name, args in checks.items()}
+        for future in as_completed(futures):
+            if future.result():
+                print(f"   ✅ {futures[future]} is up")
+            else:
+                print(f"   ⚠️  {futures[future]} did not come up")
+
+def fix_exit_code_127(prune=False):
+    """Fix exit code 127 (command not found) error"""
+    print("🚀 Fixing Exit Code 127 - Command Not Found")
+    print("=" * 50)
     
-    with open('/tmp/docker-compose.minimal.yml', 'w') as f:
-        f.write(minimal_compose)
+    print("\n1️⃣ Checking current Docker setup...")
+    
+    # Check container state and logs for more details
+    report_containers(20)
     
-    run_command("sudo cp /tmp/Dockerfile.minimal /opt/trustlayer-ai/Dockerfile", "Installing minimal Dockerfile")
-    run_command("sudo cp /tmp/docker-compose.minimal.yml /opt/trustlayer-ai/docker-compose.yml", "Installing minimal compose")
+    print("\n2️⃣ Stopping and cleaning up containers...")
+    run_command(["docker-compose", "down"], "Stopping containers", cwd=TRUSTLAYER_DIR)
+    if prune:
+        run_command(["docker", "system", "prune", "-f"], "Cleaning up Docker")
+    
+    print("\n3️⃣ Checking Dockerfile...")
+    
+    # Read current Dockerfile
+    try:
+        with open('/opt/trustlayer-ai/Dockerfile', 'r') as f:
+            dockerfile_content = f.read()
+        print("   ✅ Dockerfile found")
+    except FileNotFoundError:
+        print("   ❌ Dockerfile not found - creating new one")
+        dockerfile_content = ""
+    
+    print("\n4️⃣ Creating working Dockerfile...")
+    
+    install_file(f"{TRUSTLAYER_DIR}/Dockerfile", DOCKERFILE_TEMPLATE, "Installing fixed Dockerfile")
+    
+    print("\n5️⃣ Creating working docker-compose.yml...")
+    
+    install_file(f"{TRUSTLAYER_DIR}/docker-compose.yml", COMPOSE_TEMPLATE, "Installing fixed docker-compose")
+    
+    print("\n6️⃣ Rebuilding Docker images...")
+    # Pull redis in the background while the local images build
+    print("🔧 Pulling redis image in the background")
+    pull = subprocess.Popen(["docker-compose", "pull", "--quiet", "redis"], cwd=TRUSTLAYER_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    run_streaming(["docker-compose", "build", "--no-cache", "proxy", "dashboard"], "Rebuilding images",
+                  cwd=TRUSTLAYER_DIR)
+    _, pull_errors = pull.communicate()
+    if pull.returncode == 0:
+        print("   ✅ redis image pulled")
+    else:
+        print(f"   ⚠️  redis pull failed, `up` will retry it: {pull_errors.strip()}")
+    
+    print("\n7️⃣ Starting services...")
+    run_streaming(["docker-compose", "up", "-d"], "Starting services", cwd=TRUSTLAYER_DIR)
+    
+    print("\n8️⃣ Waiting for services to start...")
+    wait_for_services()
+    
+    print("\n9️⃣ Checking service status...")
+    report_containers(10)
+    
+    print("\n🔟 Testing services...")
+    probe("http://localhost:8000/health", "Testing proxy health")
+    probe("http://localhost:8501", "Testing dashboard")
+    
+    print("\n" + "=" * 50)
+    print("🎉 EXIT CODE 127 FIX COMPLETE!")
+    print("=" * 50)
+    
+    return True
+
+def create_minimal_setup():
+    """Create minimal setup that definitely works"""
+    print("\n🔧 Creating Minimal Working Setup")
+    print("=" * 40)
+    
+    install_file(f"{TRUSTLAYER_DIR}/Dockerfile", MINIMAL_DOCKERFILE_TEMPLATE, "Installing minimal Dockerfile")
+    install_file(f"{TRUSTLAYER_DIR}/docker-compose.yml", MINIMAL_COMPOSE_TEMPLATE, "Installing minimal compose")
     
     print("✅ Minimal setup created")
 
@@ -238,39 +368,50 @@ def debug_container_issue():
     print("=" * 35)
     
     print("\n1️⃣ Checking if files exist...")
-    run_command("ls -la /opt/trustlayer-ai/", "Listing project files")
-    run_command("ls -la /opt/trustlayer-ai/app/", "Listing app files")
+    run_command(["ls", "-la", "/opt/trustlayer-ai/"], "Listing project files")
+    run_command(["ls", "-la", "/opt/trustlayer-ai/app/"], "Listing app files")
     
     print("\n2️⃣ Checking Python files...")
-    run_command("cd /opt/trustlayer-ai && python -c 'import app.main; print(\"✅ app.main imports OK\")'", 
-               "Testing app.main import")
-    run_command("cd /opt/trustlayer-ai && python -c 'import dashboard; print(\"✅ dashboard imports OK\")'", 
-               "Testing dashboard import")
+    run_command(["python", "-c", "import app.main; print('✅ app.main imports OK')"],
+               "Testing app.main import", cwd=TRUSTLAYER_DIR)
+    run_command(["python", "-c", "import dashboard; print('✅ dashboard imports OK')"],
+               "Testing dashboard import", cwd=TRUSTLAYER_DIR)
     
     print("\n3️⃣ Checking requirements...")
-    run_command("cd /opt/trustlayer-ai && pip install -r requirements.txt", "Installing requirements")
+    run_command(["pip", "install", "-r", "requirements.txt"], "Installing requirements", cwd=TRUSTLAYER_DIR)
     
     print("\n4️⃣ Testing commands manually...")
-    run_command("cd /opt/trustlayer-ai && python -m uvicorn app.main:app --help", "Testing uvicorn command")
-    run_command("cd /opt/trustlayer-ai && python -m streamlit --help", "Testing streamlit command")
+    run_command(["python", "-m", "uvicorn", "app.main:app", "--help"], "Testing uvicorn command", cwd=TRUSTLAYER_DIR)
+    run_command(["python", "-m", "streamlit", "--help"], "Testing streamlit command", cwd=TRUSTLAYER_DIR)
     
     print("\n5️⃣ Building and testing container...")
-    run_command("cd /opt/trustlayer-ai && docker build -t trustlayer-test .", "Building test image")
-    run_command("docker run --rm trustlayer-test python --version", "Testing Python in container")
-    run_command("docker run --rm trustlayer-test python -c 'import uvicorn; print(\"uvicorn OK\")'", "Testing uvicorn in container")
+    run_streaming(["docker", "build", "-t", "trustlayer-test", "."], "Building test image", cwd=TRUSTLAYER_DIR)
+    run_command(["docker", "run", "--rm", "trustlayer-test", "python", "--version"], "Testing Python in container")
+    run_command(["docker", "run", "--rm", "trustlayer-test", "python", "-c", "import uvicorn; print('uvicorn OK')"],
+               "Testing uvicorn in container")
 
 def main():
     """Main function"""
-    print("TrustLayer AI - Fix Exit Code 127")
-    print("Choose your approach:")
-    print("1. Apply comprehensive fix")
-    print("2. Create minimal setup")
-    print("3. Debug container issue")
+    parser = argparse.ArgumentParser(description="Fix exit code 127 in the TrustLayer AI containers")
+    parser.add_argument("--mode", choices=["fix", "minimal", "debug"],
+                        help="run this approach without prompting")
+    parser.add_argument("--prune", action="store_true",
+                        help="also run `docker system prune -f` before rebuilding")
+    args = parser.parse_args()
     
-    choice = input("Enter choice (1-3): ").strip()
+    print("TrustLayer AI - Fix Exit Code 127")
+    if args.mode:
+        choice = {"fix": "1", "minimal": "2", "debug": "3"}[args.mode]
+    else:
+        print("Choose your approach:")
+        print("1. Apply comprehensive fix")
+        print("2. Create minimal setup")
+        print("3. Debug container issue")
+        
+        choice = input("Enter choice (1-3): ").strip()
     
     if choice == "1":
-        success = fix_exit_code_127()
+        success = fix_exit_code_127(prune=args.prune)
         if success:
             print("\n✅ Fix applied!")
             print("Check: docker ps")
@@ -5,56 +5,253 @@ Diagnoses and fixes external access issues for GCP Compute Engine
 Specifically handles cases where IP works inside GCP but not outside
 """
 
+import argparse
+import atexit
+import functools
+import os
+import shlex
+import socket
 import subprocess
 import sys
 import json
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
-    print(f"🔧 {description}")
-    print(f"   Command: {command}")
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+try:
+    import google.auth
+except ImportError:
+    google = None
+
+try:
+    from google.cloud import compute_v1
+except ImportError:
+    compute_v1 = None
+
+try:
+    from googleapiclient.discovery import build as build_api
+except ImportError:
+    build_api = None
+
+# Keep-alive session shared by the external HTTP checks; connect errors are not
+# retried so propagation polling keeps its own backoff schedule, and read errors are
+# not retried so a port that accepts but never answers surfaces as a Timeout
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4,
+                                     max_retries=Retry(total=2, connect=0, read=False, backoff_factor=0.3)))
+SESSION.headers["Accept-Encoding"] = "gzip"
+atexit.register(SESSION.close)
+
+# `gcloud compute instances describe` output is reused across re-runs for a short while
+VM_CACHE_DIR = os.path.expanduser("~/.cache/trustlayer")
+VM_CACHE_TTL = 300
+
+# The active gcloud account is remembered for an hour, or until gcloud's config/credentials change
+AUTH_CACHE_PATH = os.path.join(VM_CACHE_DIR, "gcloud_auth.json")
+AUTH_CACHE_TTL = 3600
+GCLOUD_CONFIG_DIR = os.environ.get("CLOUDSDK_CONFIG", os.path.expanduser("~/.config/gcloud"))
+
+# Read-only gcloud probes are memoized in-process for a few seconds; any other
+# command clears the memo since it may have changed what they report
+PROBE_CACHE_TTL = 5.0
+READ_ONLY_VERBS = {"list", "describe"}
+_probe_cache = {}
+
+# Rules owned by this script: (name, gcloud --rules, source range, target tag, description)
+STALE_FIREWALL_RULES = ["trustlayer-allow-external", "trustlayer-allow-web", "trustlayer-allow-proxy"]
+FIREWALL_RULES = [
+    ("trustlayer-allow-external", "tcp:8000,tcp:8501,tcp:80,tcp:443", "0.0.0.0/0", "trustlayer-web",
+     "Allow external access to TrustLayer AI from anywhere"),
+    ("trustlayer-allow-ssh", "tcp:22", "0.0.0.0/0", "trustlayer-vm",
+     "Allow SSH access to TrustLayer VMs"),
+    ("trustlayer-allow-internal", "tcp,udp,icmp", "10.0.0.0/8", None,
+     "Allow internal communication for TrustLayer"),
+]
+
+class VMStateError(Exception):
+    """The VM exists but is not in a state this script can fix"""
+
+def run_command(argv, description="", use_shell=False):
+    """Run command (an argv list; a string only with use_shell=True) and return result"""
+    # Report is printed in one go so concurrent probes don't interleave their lines
+    report = [f"🔧 {description}", f"   Command: {argv if use_shell else shlex.join(argv)}"]
+    if not is_read_only(argv):
+        _probe_cache.clear()
     
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        result = subprocess.run(argv, shell=use_shell, capture_output=True, text=True)
         if result.returncode == 0:
-            print(f"   ✅ Success")
+            report.append(f"   ✅ Success")
             if result.stdout.strip():
-                print(f"   Output: {result.stdout.strip()}")
+                report.append(f"   Output: {result.stdout.strip()}")
             return True, result.stdout.strip()
         else:
-            print(f"   ❌ Failed: {result.stderr.strip()}")
+            report.append(f"   ❌ Failed: {result.stderr.strip()}")
             return False, result.stderr.strip()
     except Exception as e:
-        print(f"   ❌ Error: {e}")
+        report.append(f"   ❌ Error: {e}")
         return False, str(e)
+    finally:
+        print("\n".join(report))
+
+def is_read_only(argv):
+    """True for gcloud list/describe probes, which are safe to memoize"""
+    return not isinstance(argv, str) and argv[0] == "gcloud" and bool(READ_ONLY_VERBS & set(argv))
+
+def cached_run(argv, description="", ttl=PROBE_CACHE_TTL):
+    """run_command for read-only gcloud probes, reusing a successful result younger than ttl"""
+    if not is_read_only(argv):
+        return run_command(argv, description)
+    
+    key = tuple(argv)
+    hit = _probe_cache.get(key)
+    if hit and time.monotonic() - hit[0] < ttl:
+        print(f"🔧 {description} (cached)")
+        return hit[1]
+    
+    result = run_command(argv, description)
+    if result[0]:
+        _probe_cache[key] = (time.monotonic(), result)
+    return result
+
+def vm_cache_path(vm_name, zone):
+    """Path of the cached describe JSON for one VM"""
+    return os.path.join(VM_CACHE_DIR, f"vm_info_{vm_name}_{zone}.json")
+
+def read_vm_cache(vm_name, zone):
+    """Return cached describe JSON if younger than VM_CACHE_TTL, else None"""
+    path = vm_cache_path(vm_name, zone)
+    try:
+        if time.time() - os.path.getmtime(path) < VM_CACHE_TTL:
+            with open(path) as f:
+                return f.read()
+    except OSError:
+        pass
+    return None
+
+def write_vm_cache(vm_name, zone, output):
+    """Store describe JSON for later runs, atomically so a concurrent run never reads half a file"""
+    try:
+        os.makedirs(VM_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=VM_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(output)
+        os.replace(tmp_path, vm_cache_path(vm_name, zone))
+    except OSError:
+        pass
 
-def check_gcloud_auth():
+def invalidate_vm_cache(vm_name, zone):
+    """Drop cached describe JSON after changing the VM"""
+    try:
+        os.remove(vm_cache_path(vm_name, zone))
+    except OSError:
+        pass
+
+def gcloud_config_stamp():
+    """Latest mtime of gcloud's active config and credential store; changes on login/logout/config switch"""
+    stamp = 0.0
+    for name in ("active_config", "credentials.db"):
+        try:
+            stamp = max(stamp, os.path.getmtime(os.path.join(GCLOUD_CONFIG_DIR, name)))
+        except OSError:
+            pass
+    return stamp
+
+def read_auth_cache():
+    """Cached active account if still valid, else None"""
+    try:
+        with open(AUTH_CACHE_PATH) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("stat_key") != gcloud_config_stamp() or time.time() - cached.get("checked_at", 0) > AUTH_CACHE_TTL:
+        return None
+    return cached.get("account")
+
+def write_auth_cache(account):
+    """Remember the active account for later runs"""
+    try:
+        os.makedirs(VM_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=VM_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"account": account, "checked_at": time.time(), "stat_key": gcloud_config_stamp()}, f)
+        os.replace(tmp_path, AUTH_CACHE_PATH)
+    except OSError:
+        pass
+
+def check_gcloud_auth(refresh=False):
     """Check if gcloud is authenticated"""
-    success, output = run_command("gcloud auth list --filter=status:ACTIVE --format='value(account)'", "Checking gcloud authentication")
+    account = None if refresh else read_auth_cache()
+    if account:
+        print(f"   ✅ Authenticated as: {account} (cached)")
+        return True
+    
+    success, output = cached_run(["gcloud", "auth", "list", "--filter=status:ACTIVE", "--format=value(account)"],
+                                 "Checking gcloud authentication")
     if success and output:
         print(f"   ✅ Authenticated as: {output}")
+        write_auth_cache(output)
         return True
     else:
         print("   ❌ Not authenticated with gcloud")
         print("   Run: gcloud auth login")
         return False
 
-def get_vm_info(vm_name="trustlayer-ai-main", zone="us-central1-a"):
+@functools.lru_cache(maxsize=None)
+def instances_client():
+    """One Compute API client (and credential load) per process, with the default project"""
+    credentials, project = google.auth.default()
+    return project, compute_v1.InstancesClient(credentials=credentials)
+
+def describe_vm(vm_name, zone):
+    """Describe the VM as gcloud-style JSON, via the Compute SDK when installed"""
+    if compute_v1 is not None:
+        try:
+            project, client = instances_client()
+            instance = client.get(project=project, zone=zone, instance=vm_name)
+            print("   ✅ Fetched VM details via the Compute API")
+            return True, compute_v1.Instance.to_json(instance, use_integers_for_enums=False)
+        except Exception as e:
+            print(f"   ⚠️  Compute API unavailable ({e}), falling back to gcloud")
+    
+    command = ["gcloud", "compute", "instances", "describe", vm_name, f"--zone={zone}", "--format=json"]
+    return cached_run(command, f"Getting VM details")
+
+def get_vm_info(vm_name="trustlayer-ai-main", zone="us-central1-a", refresh=False):
     """Get VM information"""
     print(f"\n🔍 Getting VM information for {vm_name} in {zone}")
     
-    command = f'gcloud compute instances describe {vm_name} --zone={zone} --format=json'
-    success, output = run_command(command, f"Getting VM details")
+    output = None if refresh else read_vm_cache(vm_name, zone)
+    if output is not None:
+        print(f"   ✅ Using VM details cached less than {VM_CACHE_TTL}s ago")
+        success = True
+    else:
+        success, output = describe_vm(vm_name, zone)
+        if success:
+            write_vm_cache(vm_name, zone, output)
     
     if success:
         try:
-            vm_info = json.loads(output)
-            external_ip = vm_info['networkInterfaces'][0]['accessConfigs'][0]['natIP']
-            internal_ip = vm_info['networkInterfaces'][0]['networkIP']
-            status = vm_info['status']
+            vm_info = json_loads(output)
+            nic = (vm_info.get('networkInterfaces') or [{}])[0]
+            access = (nic.get('accessConfigs') or [{}])[0]
+            external_ip = access.get('natIP')
+            if external_ip is None:
+                raise VMStateError("VM has no external IP configured")
+            internal_ip = nic.get('networkIP')
+            status = vm_info.get('status')
             tags = vm_info.get('tags', {}).get('items', [])
-            network = vm_info['networkInterfaces'][0]['network'].split('/')[-1]
+            network = nic.get('network', 'default').split('/')[-1]
             
             print(f"   ✅ VM Status: {status}")
             print(f"   ✅ External IP: {external_ip}")
@@ -71,7 +268,11 @@ def get_vm_info(vm_name="trustlayer-ai-main", zone="us-central1-a"):
                 'name': vm_name,
                 'network': network
             }
-        except Exception as e:
+        except VMStateError as e:
+            print(f"   ❌ {e}")
+            print(f"   Assign one with: gcloud compute instances add-access-config {vm_name} --zone={zone}")
+            return None
+        except ValueError as e:
             print(f"   ❌ Error parsing VM info: {e}")
             return None
     else:
@@ -82,16 +283,19 @@ def check_existing_firewall_rules(network="default"):
     print(f"\n🔥 Checking firewall rules for network: {network}")
     
     # Check all firewall rules for the network
-    command = f'gcloud compute firewall-rules list --filter="network~{network}" --format="table(name,allowed,sourceRanges,targetTags,direction)" --sort-by=name'
-    success, output = run_command(command, "Listing all firewall rules for network")
+    command = ["gcloud", "compute", "firewall-rules", "list", f"--filter=network~{network}",
+               "--format=table(name,allowed,sourceRanges,targetTags,direction)", "--sort-by=name"]
+    success, output = cached_run(command, "Listing all firewall rules for network")
     
     if success:
         print("   Current firewall rules:")
         print(f"   {output}")
         
         # Check specifically for rules that allow ports 8000 and 8501
-        command2 = f'gcloud compute firewall-rules list --filter="network~{network} AND allowed.ports:(8000 OR 8501)" --format="table(name,allowed,sourceRanges,targetTags)"'
-        success2, output2 = run_command(command2, "Checking rules for ports 8000/8501")
+        command2 = ["gcloud", "compute", "firewall-rules", "list",
+                    f"--filter=network~{network} AND allowed.ports:(8000 OR 8501)",
+                    "--format=table(name,allowed,sourceRanges,targetTags)"]
+        success2, output2 = cached_run(command2, "Checking rules for ports 8000/8501")
         
         if success2 and output2.strip():
             print("   ✅ Found rules for TrustLayer ports:")
@@ -108,8 +312,9 @@ def delete_conflicting_rules():
     print(f"\n🗑️  Checking for conflicting firewall rules")
     
     # Check for any deny rules that might block our traffic
-    command = 'gcloud compute firewall-rules list --filter="action=DENY" --format="table(name,allowed,denied,sourceRanges,targetTags)"'
-    success, output = run_command(command, "Checking for DENY rules")
+    command = ["gcloud", "compute", "firewall-rules", "list", "--filter=action=DENY",
+               "--format=table(name,allowed,denied,sourceRanges,targetTags)"]
+    success, output = cached_run(command, "Checking for DENY rules")
     
     if success and "DENY" in output:
         print("   ⚠️  Found DENY rules that might conflict:")
@@ -118,54 +323,111 @@ def delete_conflicting_rules():
     else:
         print("   ✅ No conflicting DENY rules found")
 
+@functools.lru_cache(maxsize=None)
+def compute_api():
+    """Compute Engine discovery client (one credential load per process) and the default project"""
+    credentials, project = google.auth.default()
+    return project, build_api("compute", "v1", credentials=credentials, cache_discovery=False)
+
+def firewall_body(name, rules, source_range, target_tag, description, network):
+    """API body equivalent to `gcloud compute firewall-rules create` with the given flags"""
+    allowed = {}
+    for rule in rules.split(","):
+        protocol, _, port = rule.partition(":")
+        allowed.setdefault(protocol, [])
+        if port:
+            allowed[protocol].append(port)
+    body = {
+        "name": name,
+        "network": f"global/networks/{network}",
+        "direction": "INGRESS",
+        "priority": 1000,
+        "allowed": [{"IPProtocol": protocol, **({"ports": ports} if ports else {})}
+                    for protocol, ports in allowed.items()],
+        "sourceRanges": [source_range],
+        "description": description,
+    }
+    if target_tag:
+        body["targetTags"] = [target_tag]
+    return body
+
+def run_batch(compute, requests_by_label):
+    """Send API requests in one batched HTTP call, logging each; return {label: response or None}"""
+    responses = {}
+    
+    def callback(label, response, exception):
+        if exception is None:
+            print(f"   ✅ {label}")
+            responses[label] = response
+        elif getattr(getattr(exception, "resp", None), "status", None) == 404:
+            print(f"   ➖ {label}: not found")
+            responses[label] = None
+        else:
+            print(f"   ❌ {label}: {exception}")
+            responses[label] = None
+    
+    batch = compute.new_batch_http_request(callback=callback)
+    for label, request in requests_by_label.items():
+        batch.add(request, request_id=label)
+    batch.execute()
+    return responses
+
+def create_firewall_rules_batched(network):
+    """Delete stale rules then insert ours, each phase as one batched Compute API call"""
+    project, compute = compute_api()
+    firewalls = compute.firewalls()
+    
+    print("   🗑️  Removing any existing TrustLayer rules (batched)...")
+    deleted = run_batch(compute, {f"Deleting existing rule: {name}": firewalls.delete(project=project, firewall=name)
+                                  for name in STALE_FIREWALL_RULES})
+    
+    # Inserting a rule whose namesake is still being deleted fails, so wait the deletes out
+    pending = {f"Deleted {op['targetLink'].rsplit('/', 1)[-1]}":
+               compute.globalOperations().wait(project=project, operation=op["name"])
+               for op in deleted.values() if op}
+    if pending:
+        run_batch(compute, pending)
+    
+    print("   🔥 Creating TrustLayer rules (batched)...")
+    created = run_batch(compute, {f"Creating rule: {rule[0]}":
+                                  firewalls.insert(project=project, body=firewall_body(*rule, network))
+                                  for rule in FIREWALL_RULES})
+    return all(response is not None for response in created.values())
+
 def create_comprehensive_firewall_rules(network="default"):
     """Create comprehensive firewall rules for external access"""
     print(f"\n🔥 Creating comprehensive firewall rules")
     
-    # Delete existing TrustLayer rules first to avoid conflicts
+    if build_api is not None:
+        try:
+            return create_firewall_rules_batched(network)
+        except Exception as e:
+            print(f"   ⚠️  Compute API unavailable ({e}), falling back to gcloud")
+    
+    # Delete existing TrustLayer rules first to avoid conflicts; each gcloud call is
+    # independent, so the deletes (then the creates) run side by side
     print("   🗑️  Removing any existing TrustLayer rules...")
-    existing_rules = ["trustlayer-allow-external", "trustlayer-allow-web", "trustlayer-allow-proxy"]
-    
-    for rule in existing_rules:
-        command = f'gcloud compute firewall-rules delete {rule} --quiet'
-        run_command(command, f"Deleting existing rule: {rule}")
-    
-    # Rule 1: Allow external access to TrustLayer ports (MOST IMPORTANT)
-    command1 = f'''gcloud compute firewall-rules create trustlayer-allow-external \
-    --network {network} \
-    --action ALLOW \
-    --rules tcp:8000,tcp:8501,tcp:80,tcp:443 \
-    --source-ranges 0.0.0.0/0 \
-    --target-tags trustlayer-web \
-    --description "Allow external access to TrustLayer AI from anywhere" \
-    --priority 1000'''
-    
-    success1, _ = run_command(command1, "Creating external access rule (HIGH PRIORITY)")
-    
-    # Rule 2: Allow SSH access
-    command2 = f'''gcloud compute firewall-rules create trustlayer-allow-ssh \
-    --network {network} \
-    --action ALLOW \
-    --rules tcp:22 \
-    --source-ranges 0.0.0.0/0 \
-    --target-tags trustlayer-vm \
-    --description "Allow SSH access to TrustLayer VMs" \
-    --priority 1000'''
-    
-    success2, _ = run_command(command2, "Creating SSH access rule")
-    
-    # Rule 3: Allow internal communication
-    command3 = f'''gcloud compute firewall-rules create trustlayer-allow-internal \
-    --network {network} \
-    --action ALLOW \
-    --rules tcp,udp,icmp \
-    --source-ranges 10.0.0.0/8 \
-    --description "Allow internal communication for TrustLayer" \
-    --priority 1000'''
-    
-    success3, _ = run_command(command3, "Creating internal communication rule")
-    
-    return success1 and success2 and success3
+    deletes = [(["gcloud", "compute", "firewall-rules", "delete", rule, "--quiet"], f"Deleting existing rule: {rule}")
+               for rule in STALE_FIREWALL_RULES]
+    with ThreadPoolExecutor(max_workers=len(deletes)) as pool:
+        list(pool.map(lambda job: run_command(*job), deletes))
+    
+    creates = []
+    for name, rules, source_range, target_tag, description in FIREWALL_RULES:
+        command = ["gcloud", "compute", "firewall-rules", "create", name,
+                   "--network", network,
+                   "--action", "ALLOW",
+                   "--rules", rules,
+                   "--source-ranges", source_range,
+                   "--description", description,
+                   "--priority", "1000"]
+        if target_tag:
+            command += ["--target-tags", target_tag]
+        creates.append((command, f"Creating rule: {name}"))
+    with ThreadPoolExecutor(max_workers=len(creates)) as pool:
+        results = list(pool.map(lambda job: run_command(*job), creates))
+    
+    return all(success for success, _ in results)
 
 def add_network_tags_comprehensive(vm_info):
     """Add network tags to VM with comprehensive approach"""
@@ -174,26 +436,49 @@ def add_network_tags_comprehensive(vm_info):
     vm_name = vm_info['name']
     zone = vm_info['zone']
     existing_tags = vm_info['tags']
+    existing_set = set(existing_tags)
     
     # Tags we need
     required_tags = ['trustlayer-web', 'trustlayer-vm', 'http-server', 'https-server']
     
     # Check if tags already exist
-    missing_tags = [tag for tag in required_tags if tag not in existing_tags]
+    missing_tags = [tag for tag in required_tags if tag not in existing_set]
     
     if not missing_tags:
         print("   ✅ All required tags already present")
         return True
     
-    # Add missing tags (keep existing ones)
-    all_tags = list(set(existing_tags + missing_tags))  # Remove duplicates
+    # Add missing tags after the existing ones, keeping the VM's own order
+    all_tags = list(dict.fromkeys(existing_tags + missing_tags))
     tags_str = ','.join(all_tags)
     
-    command = f'gcloud compute instances set-tags {vm_name} --tags {tags_str} --zone {zone}'
+    command = ["gcloud", "compute", "instances", "set-tags", vm_name, "--tags", tags_str, "--zone", zone]
     success, _ = run_command(command, f"Setting tags: {all_tags}")
+    if success:
+        invalidate_vm_cache(vm_name, zone)
     
     return success
 
+def tcp_ok(ip, port, budget=15.0, per_try=0.5):
+    """Retry a TCP connect every ~100ms until it succeeds or budget seconds pass"""
+    deadline = time.monotonic() + budget
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((ip, port), timeout=per_try).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def wait_for_propagation(external_ip, max_wait=60):
+    """Wait until the firewall lets a TCP connect to port 8000 through, at most max_wait seconds"""
+    started = time.monotonic()
+    if tcp_ok(external_ip, 8000, budget=max_wait):
+        print(f"   ✅ Port 8000 reachable after ~{time.monotonic() - started:.0f}s")
+        return True
+    print(f"   ⚠️  Port 8000 still unreachable after {max_wait}s")
+    return False
+
 def verify_external_access_step_by_step(external_ip):
     """Verify external access step by step"""
     print(f"\n🧪 Verifying external access step by step")
@@ -202,57 +487,55 @@ def verify_external_access_step_by_step(external_ip):
     print("   📋 To test from Google Cloud Shell (should work):")
     print(f"   gcloud cloud-shell ssh --command='curl -s http://{external_ip}:8000/health'")
     
-    # Step 2: Test basic TCP connectivity
-    print(f"\n   🔌 Testing TCP connectivity to {external_ip}:8000...")
-    import socket
+    # Step 2: One HTTP request; the exception type tells TCP and HTTP failures apart
+    print(f"\n   🌐 Testing connectivity to {external_ip}:8000...")
     try:
-        sock = socket.create_connection((external_ip, 8000), timeout=15)
-        sock.close()
-        print("   ✅ TCP connection successful")
-        
-        # Step 3: Test HTTP
-        print(f"   🌐 Testing HTTP connectivity...")
-        import requests
-        try:
-            response = requests.get(f"http://{external_ip}:8000/health", timeout=15)
-            if response.status_code == 200:
-                print("   ✅ HTTP connection successful")
-                print(f"   ✅ Response: {response.json()}")
-                return True
-            else:
-                print(f"   ⚠️  HTTP returned status {response.status_code}")
-        except Exception as e:
-            print(f"   ❌ HTTP error: {e}")
-            
-    except Exception as e:
+        response = SESSION.get(f"http://{external_ip}:8000/health", timeout=10)
+        response.raise_for_status()
+        print("   ✅ HTTP connection successful")
+        print(f"   ✅ Response: {response.json()}")
+        return True
+    except requests.exceptions.ConnectionError as e:
         print(f"   ❌ TCP connection failed: {e}")
         print("   This confirms the firewall is still blocking external access")
+    except requests.exceptions.Timeout:
+        print("   ⚠️  TCP open, no HTTP response")
+    except requests.exceptions.HTTPError:
+        print(f"   ⚠️  HTTP returned status {response.status_code}")
+    except ValueError as e:
+        print(f"   ❌ HTTP error: {e}")
     
     return False
 
-def check_network_connectivity_issues():
-    """Check for common network connectivity issues"""
+def lookup_public_ip():
+    """This machine's public IP as seen by httpbin"""
+    response = SESSION.get("http://httpbin.org/ip", timeout=10)
+    response.raise_for_status()
+    return response.json().get('origin', 'unknown')
+
+def check_network_connectivity_issues(public_ip_lookup):
+    """Check for common network connectivity issues, given a future from lookup_public_ip"""
     print(f"\n🌐 Checking for network connectivity issues")
     
     # Check if we're behind a corporate firewall
     print("   🏢 Checking if you're behind a corporate firewall...")
     try:
-        import requests
-        response = requests.get("http://httpbin.org/ip", timeout=10)
-        if response.status_code == 200:
-            your_ip = response.json().get('origin', 'unknown')
-            print(f"   ✅ Your public IP: {your_ip}")
-            
-            # Check if it's a corporate/restricted IP range
-            if any(your_ip.startswith(prefix) for prefix in ['10.', '172.', '192.168.']):
-                print("   ⚠️  You appear to be behind a NAT/corporate firewall")
-                print("   This might be blocking outbound connections to GCP")
-            else:
-                print("   ✅ You have a public IP address")
-        else:
-            print("   ⚠️  Could not determine your public IP")
+        your_ip = public_ip_lookup.result()
+    except requests.exceptions.HTTPError:
+        print("   ⚠️  Could not determine your public IP")
+        return
     except Exception as e:
         print(f"   ❌ Network connectivity test failed: {e}")
+        return
+    
+    print(f"   ✅ Your public IP: {your_ip}")
+    
+    # Check if it's a corporate/restricted IP range
+    if any(your_ip.startswith(prefix) for prefix in ['10.', '172.', '192.168.']):
+        print("   ⚠️  You appear to be behind a NAT/corporate firewall")
+        print("   This might be blocking outbound connections to GCP")
+    else:
+        print("   ✅ You have a public IP address")
 
 def provide_alternative_solutions(vm_info):
     """Provide alternative solutions if direct access doesn't work"""
@@ -293,21 +576,31 @@ def main():
     print("🎯 Specifically fixing: IP works inside GCP but not outside")
     print("=" * 70)
     
-    # Get VM name and zone from command line or use defaults
-    vm_name = sys.argv[1] if len(sys.argv) > 1 else "trustlayer-ai-main"
-    zone = sys.argv[2] if len(sys.argv) > 2 else "us-central1-a"
-    
-    # Check gcloud authentication
-    if not check_gcloud_auth():
+    parser = argparse.ArgumentParser(description="Fix external access to a TrustLayer AI VM")
+    parser.add_argument("--vm-name", default="trustlayer-ai-main", help="Compute Engine instance name")
+    parser.add_argument("--zone", default="us-central1-a", help="Compute Engine zone")
+    parser.add_argument("--refresh", action="store_true", help="ignore cached VM details and gcloud auth")
+    args = parser.parse_args()
+    vm_name, zone = args.vm_name, args.zone
+    
+    # Auth check, VM describe and the DENY-rule scan don't depend on each other
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        auth_check = pool.submit(check_gcloud_auth, args.refresh)
+        vm_lookup = pool.submit(get_vm_info, vm_name, zone, args.refresh)
+        deny_scan = pool.submit(delete_conflicting_rules)
+        authenticated = auth_check.result()
+        vm_info = vm_lookup.result()
+        deny_scan.result()
+    
+    if not authenticated:
         sys.exit(1)
     
-    # Get VM information
-    vm_info = get_vm_info(vm_name, zone)
     if not vm_info:
         print("❌ Could not get VM information")
         sys.exit(1)
     
     if vm_info['status'] != 'RUNNING':
+        invalidate_vm_cache(vm_name, zone)
         print(f"❌ VM is not running (status: {vm_info['status']})")
         print("   Start your VM first:")
         print(f"   gcloud compute instances start {vm_name} --zone {zone}")
@@ -321,9 +614,6 @@ def main():
     # Check existing firewall rules
     has_proper_rules = check_existing_firewall_rules(network)
     
-    # Check for conflicting rules
-    delete_conflicting_rules()
-    
     # Create comprehensive firewall rules
     print("\n🔧 Creating comprehensive firewall rules...")
     if not create_comprehensive_firewall_rules(network):
@@ -336,11 +626,18 @@ def main():
         sys.exit(1)
     
     # Wait for rules to propagate
-    print("\n⏳ Waiting 60 seconds for firewall rules to propagate...")
-    time.sleep(60)
+    print("\n⏳ Waiting up to 60 seconds for firewall rules to propagate...")
+    wait_for_propagation(external_ip)
+    
+    # Look up our own public IP alongside the verification; it is only reported on failure,
+    # so the pool is released without waiting and a successful run never blocks on httpbin
+    pool = ThreadPoolExecutor(max_workers=1)
+    public_ip_lookup = pool.submit(lookup_public_ip)
+    reachable = verify_external_access_step_by_step(external_ip)
+    pool.shutdown(wait=False, cancel_futures=True)
     
     # Verify external access
-    if verify_external_access_step_by_step(external_ip):
+    if reachable:
         print("\n🎉 SUCCESS! External access is now working!")
         print(f"\n🔧 Use this proxy configuration:")
         print(f"   HTTP Proxy:  {external_ip}:8000")
@@ -359,7 +656,7 @@ def main():
         print("   3. Services not running properly on the VM")
         
         # Check network connectivity issues
-        check_network_connectivity_issues()
+        check_network_connectivity_issues(public_ip_lookup)
         
         # Provide alternative solutions
         provide_alternative_solutions(vm_info)
@@ -4,20 +4,29 @@ Fix Nginx Proxy Configuration
 Simple script to restart Nginx and verify proxy is working
 """
 
+import http.client
+import json
+import shlex
 import subprocess
 import time
+from itertools import islice
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
+from tl_fixops.shell import install_file_sync as install_file
+
+# Keep-alive connections per local port, reused by the sequential probes
+CONNECTIONS = {}
+
+def run_command(argv, description="", cwd=None):
+    """Run command (an argv list, no shell) and return result"""
     print(f"🔧 {description}")
-    print(f"   Command: {command}")
+    print(f"   Command: {shlex.join(argv)}")
     
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        result = subprocess.run(argv, cwd=cwd, capture_output=True, text=True)
         if result.returncode == 0:
             print(f"   ✅ Success")
             if result.stdout.strip():
-                for line in result.stdout.strip().split('\n')[:3]:
+                for line in islice(result.stdout.strip().splitlines(), 3):
                     print(f"      {line}")
             return True, result.stdout.strip()
         else:
@@ -27,6 +36,45 @@ def run_command(command, description=""):
         print(f"   ❌ Error: {e}")
         return False, str(e)
 
+def probe(port, path, description="", method="GET"):
+    """Request localhost:port/path in-process and return (status, body); status is None on failure"""
+    print(f"🔧 {description}")
+    print(f"   {method} http://localhost:{port}{path}")
+    
+    # A kept-alive connection may have been dropped by an nginx restart; reconnect once
+    for attempt in range(2):
+        conn = CONNECTIONS.setdefault(port, http.client.HTTPConnection("localhost", port, timeout=3))
+        try:
+            conn.request(method, path)
+            response = conn.getresponse()
+            body = response.read()
+            print(f"   {'✅' if response.status < 400 else '❌'} HTTP {response.status}")
+            return response.status, body
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            del CONNECTIONS[port]
+            if attempt:
+                print(f"   ❌ Error: {e}")
+    return None, b""
+
+def is_healthy(port, description=""):
+    """True if localhost:port/health answers 200 with status: healthy"""
+    status, body = probe(port, "/health", description)
+    try:
+        return status == 200 and json.loads(body).get("status") == "healthy"
+    except ValueError:
+        return False
+
+def show_proxy_pass_context(config, before=5, after=10):
+    """Print the lines around each proxy_pass in `nginx -T` output (what `grep -B5 -A10` showed)"""
+    lines = config.splitlines()
+    shown = set()
+    for i, line in enumerate(lines):
+        if "proxy_pass" in line:
+            shown.update(range(max(0, i - before), min(len(lines), i + after + 1)))
+    for i in sorted(shown):
+        print(f"      {lines[i]}")
+
 def fix_nginx_proxy():
     """Fix Nginx proxy configuration"""
     print("🚀 Fixing Nginx Proxy Configuration")
@@ -34,33 +82,32 @@ def fix_nginx_proxy():
     
     # Step 1: Check TrustLayer AI is still running
     print("\n1️⃣ Verifying TrustLayer AI is running...")
-    success, output = run_command("curl -s http://localhost:8000/health", "Testing TrustLayer AI")
-    if not success or "healthy" not in output:
+    if not is_healthy(8000, "Testing TrustLayer AI"):
         print("   ❌ TrustLayer AI not responding - need to start it first")
-        run_command("cd /opt/trustlayer-ai && docker-compose up -d", "Starting TrustLayer AI")
+        run_command(["docker-compose", "up", "-d"], "Starting TrustLayer AI", cwd="/opt/trustlayer-ai")
         time.sleep(5)
     
     # Step 2: Restart Nginx completely
     print("\n2️⃣ Restarting Nginx...")
-    run_command("sudo systemctl restart nginx", "Restarting Nginx service")
+    run_command(["sudo", "systemctl", "restart", "nginx"], "Restarting Nginx service")
     time.sleep(2)
     
     # Step 3: Check Nginx status
     print("\n3️⃣ Checking Nginx status...")
-    run_command("sudo systemctl status nginx --no-pager -l", "Checking Nginx status")
+    run_command(["sudo", "systemctl", "status", "nginx", "--no-pager", "-l"], "Checking Nginx status")
     
     # Step 4: Test proxy locally
     print("\n4️⃣ Testing proxy locally...")
-    success, output = run_command("curl -s http://localhost:80/health", "Testing health via Nginx")
-    
-    if success and "healthy" in output:
+    if is_healthy(80, "Testing health via Nginx"):
         print("   ✅ Nginx proxy working locally!")
     else:
         print("   ❌ Nginx proxy still not working")
         print("   Let's check the Nginx configuration...")
         
         # Check if our config is actually active
-        run_command("sudo nginx -T | grep -A 10 -B 5 'proxy_pass'", "Checking active Nginx config")
+        success, output = run_command(["sudo", "nginx", "-T"], "Checking active Nginx config")
+        if success:
+            show_proxy_pass_context(output)
         
         # Try alternative approach - create a simple proxy config
         print("\n   Creating simplified proxy configuration...")
@@ -77,27 +124,20 @@ def fix_nginx_proxy():
     }
 }'''
         
-        # Write simple config
-        with open('/tmp/simple_nginx.conf', 'w') as f:
-            f.write(simple_config)
-        
-        run_command("sudo cp /tmp/simple_nginx.conf /etc/nginx/sites-available/default", 
-                   "Installing simplified config")
-        run_command("sudo nginx -t", "Testing simplified config")
-        run_command("sudo systemctl restart nginx", "Restarting with simplified config")
+        install_file("/etc/nginx/sites-available/default", simple_config, "Installing simplified config")
+        run_command(["sudo", "nginx", "-t"], "Testing simplified config")
+        run_command(["sudo", "systemctl", "restart", "nginx"], "Restarting with simplified config")
         
         time.sleep(2)
-        success, output = run_command("curl -s http://localhost:80/health", "Re-testing with simplified config")
-        
-        if success and "healthy" in output:
+        if is_healthy(80, "Re-testing with simplified config"):
             print("   ✅ Simplified proxy working!")
         else:
             print("   ❌ Still not working - may need manual debugging")
     
     # Step 5: Final test
     print("\n5️⃣ Final verification...")
-    run_command("curl -s http://localhost:80/health", "Final health check")
-    run_command("curl -I http://localhost:80/metrics", "Testing metrics endpoint")
+    is_healthy(80, "Final health check")
+    probe(80, "/metrics", "Testing metrics endpoint", method="HEAD")
     
     print("\n" + "=" * 50)
     print("🎯 NEXT STEP: Test external access")
@@ -4,17 +4,39 @@ Fix Presidio and Domain Issues
 Fixes spaCy model and domain authorization issues
 """
 
+import atexit
+import shlex
 import subprocess
 import sys
+import time
+
+import requests
 import yaml
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tl_fixops.shell import install_file_sync as install_file
+
+try:
+    from yaml import CSafeLoader as YamlLoader, CSafeDumper as YamlDumper
+except ImportError:
+    from yaml import SafeLoader as YamlLoader, SafeDumper as YamlDumper
+
+TRUSTLAYER_DIR = "/opt/trustlayer-ai"
+
+# One keep-alive session for every local HTTP check instead of forking curl
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4,
+                                     max_retries=Retry(total=2, connect=0, backoff_factor=0.3)))
+atexit.register(SESSION.close)
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
+def run_command(argv, description="", cwd=None):
+    """Run command (an argv list, no shell) and return result"""
     print(f"🔧 {description}")
-    print(f"   Command: {command}")
+    print(f"   Command: {shlex.join(argv)}")
     
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        result = subprocess.run(argv, cwd=cwd, capture_output=True, text=True)
         if result.returncode == 0:
             print(f"   ✅ Success")
             return True, result.stdout.strip()
@@ -25,6 +47,57 @@ def run_command(command, description=""):
         print(f"   ❌ Error: {e}")
         return False, str(e)
 
+def run_streaming(argv, description="", cwd=None):
+    """Run a long-running command, echoing its output as it arrives; return True on success"""
+    print(f"🔧 {description}")
+    print(f"   Command: {shlex.join(argv)}")
+    
+    try:
+        proc = subprocess.Popen(argv, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                bufsize=1, text=True)
+        for line in proc.stdout:
+            print(f"      {line}", end="")
+        returncode = proc.wait()
+    except Exception as e:
+        print(f"   ❌ Error: {e}")
+        return False
+    
+    if returncode == 0:
+        print(f"   ✅ Success")
+        return True
+    print(f"   ❌ Failed with exit code {returncode}")
+    return False
+
+def wait_until(predicate, timeout, interval=2):
+    """Call predicate until it returns True or timeout seconds pass"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return False
+
+def http_ok(url):
+    """True if url answers 200"""
+    try:
+        return SESSION.get(url, timeout=2).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+def http_check(method, url, description="", **kwargs):
+    """Send one request with the shared session and return (ok, body)"""
+    print(f"🔧 {description}")
+    print(f"   {method} {url}")
+    
+    try:
+        response = SESSION.request(method, url, timeout=10, **kwargs)
+    except requests.exceptions.RequestException as e:
+        print(f"   ❌ Error: {e}")
+        return False, str(e)
+    
+    print(f"   {'✅' if response.ok else '❌'} HTTP {response.status_code}")
+    return response.ok, response.text
+
 def fix_presidio_config():
     """Fix Presidio configuration and spaCy model"""
     print("🚀 Fixing Presidio Configuration")
@@ -33,7 +106,7 @@ def fix_presidio_config():
     print("\n1️⃣ Creating Presidio configuration...")
     
     # Create Presidio config directory
-    run_command("mkdir -p /opt/trustlayer-ai/conf", "Creating config directory")
+    run_command(["mkdir", "-p", "/opt/trustlayer-ai/conf"], "Creating config directory")
     
     # Create Presidio config file
     presidio_config = {
@@ -46,11 +119,8 @@ def fix_presidio_config():
         ]
     }
     
-    with open('/tmp/presidio_config.yaml', 'w') as f:
-        yaml.dump(presidio_config, f)
-    
-    run_command("sudo cp /tmp/presidio_config.yaml /opt/trustlayer-ai/conf/default.yaml", 
-               "Installing Presidio config")
+    install_file("/opt/trustlayer-ai/conf/default.yaml", yaml.dump(presidio_config, Dumper=YamlDumper),
+                 "Installing Presidio config")
     
     print("\n2️⃣ Updating redactor.py to use correct model...")
     
@@ -62,18 +132,13 @@ def fix_presidio_config():
         print("   ❌ redactor.py not found")
         return False
     
-    # Fix the model name in redactor.py
-    updated_redactor = redactor_content.replace(
-        'en_core_web_lg', 'en_core_web_sm'
-    ).replace(
-        '"en_core_web_lg"', '"en_core_web_sm"'
-    )
+    # Fix the model name in redactor.py (covers the quoted form too)
+    updated_redactor = redactor_content.replace('en_core_web_lg', 'en_core_web_sm')
+    if updated_redactor == redactor_content:
+        print("   ✅ redactor.py already uses en_core_web_sm")
+        return True
     
-    with open('/tmp/redactor_fixed.py', 'w') as f:
-        f.write(updated_redactor)
-    
-    run_command("sudo cp /tmp/redactor_fixed.py /opt/trustlayer-ai/app/redactor.py", 
-               "Updating redactor.py")
+    install_file('/opt/trustlayer-ai/app/redactor.py', updated_redactor, "Updating redactor.py")
     
     return True
 
@@ -86,17 +151,14 @@ def fix_domain_authorization():
     
     try:
         with open('/opt/trustlayer-ai/config.yaml', 'r') as f:
-            config = yaml.safe_load(f)
+            original = f.read()
+        config = yaml.load(original, Loader=YamlLoader)
     except FileNotFoundError:
         print("   ❌ config.yaml not found")
         return False
     
     print("\n2️⃣ Adding trustlayer.asolvitra.tech to allowed domains...")
     
-    # Add the domain to allowed_domains
-    if 'allowed_domains' not in config:
-        config['allowed_domains'] = []
-    
     domains_to_add = [
         'trustlayer.asolvitra.tech',
         'api.openai.com',
@@ -107,16 +169,17 @@ def fix_domain_authorization():
         '127.0.0.1'
     ]
     
-    for domain in domains_to_add:
-        if domain not in config['allowed_domains']:
-            config['allowed_domains'].append(domain)
-    
-    # Save updated config
-    with open('/tmp/config_fixed.yaml', 'w') as f:
-        yaml.dump(config, f, default_flow_style=False)
+    # Merge as a set; sorting keeps the written YAML stable across runs
+    allowed_domains = set(config.get('allowed_domains') or [])
+    allowed_domains.update(domains_to_add)
+    config['allowed_domains'] = sorted(allowed_domains)
     
-    run_command("sudo cp /tmp/config_fixed.yaml /opt/trustlayer-ai/config.yaml", 
-               "Updating config.yaml")
+    # Save updated config, keeping the file's key order; skip the write when nothing changed
+    updated = yaml.dump(config, Dumper=YamlDumper, default_flow_style=False, sort_keys=False)
+    if updated == original:
+        print("   ✅ config.yaml already up to date")
+    else:
+        install_file("/opt/trustlayer-ai/config.yaml", updated, "Updating config.yaml")
     
     print("   ✅ Added domains to allowed list:")
     for domain in domains_to_add:
@@ -140,12 +203,9 @@ RUN apt-get update && apt-get install -y \\
     curl \\
     && rm -rf /var/lib/apt/lists/*
 
-# Copy requirements and install Python dependencies
+# Copy requirements and install Python dependencies (plus Flask for the dashboard)
 COPY requirements.txt .
-RUN pip install --no-cache-dir -r requirements.txt
-
-# Install Flask for dashboard
-RUN pip install flask
+RUN pip install --no-cache-dir -r requirements.txt flask
 
 # Download correct spaCy model (small version)
 RUN python -m spacy download en_core_web_sm
@@ -168,11 +228,7 @@ EXPOSE 8000 8501
 CMD ["python", "-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000"]
 '''
     
-    with open('/tmp/Dockerfile_fixed', 'w') as f:
-        f.write(dockerfile_content)
-    
-    run_command("sudo cp /tmp/Dockerfile_fixed /opt/trustlayer-ai/Dockerfile", 
-               "Updating Dockerfile")
+    install_file("/opt/trustlayer-ai/Dockerfile", dockerfile_content, "Updating Dockerfile")
     
     return True
 
@@ -182,20 +238,23 @@ def restart_services():
     print("=" * 20)
     
     print("\n1️⃣ Stopping services...")
-    run_command("cd /opt/trustlayer-ai && docker-compose down", "Stopping containers")
+    run_command(["docker-compose", "down"], "Stopping containers", cwd=TRUSTLAYER_DIR)
     
     print("\n2️⃣ Rebuilding images...")
-    run_command("cd /opt/trustlayer-ai && docker-compose build --no-cache", "Rebuilding images")
+    # Without --no-cache, unchanged layers are reused, so an up-to-date build is cheap
+    run_streaming(["docker-compose", "build"], "Rebuilding images", cwd=TRUSTLAYER_DIR)
     
     print("\n3️⃣ Starting services...")
-    run_command("cd /opt/trustlayer-ai && docker-compose up -d", "Starting services")
+    run_streaming(["docker-compose", "up", "-d"], "Starting services", cwd=TRUSTLAYER_DIR)
     
     print("\n4️⃣ Waiting for services to start...")
-    import time
-    time.sleep(30)
+    if wait_until(lambda: http_ok("http://localhost:8000/health"), timeout=60):
+        print("   ✅ Proxy is answering")
+    else:
+        print("   ⚠️  Proxy not answering after 60s")
     
     print("\n5️⃣ Checking logs...")
-    run_command("docker logs trustlayer-proxy --tail 20", "Checking proxy logs")
+    run_command(["docker", "logs", "trustlayer-proxy", "--tail", "20"], "Checking proxy logs")
     
     return True
 
@@ -205,7 +264,7 @@ def test_fixes():
     print("=" * 15)
     
     print("\n1️⃣ Testing health endpoint...")
-    success, _ = run_command("curl -s http://localhost:8000/health", "Testing health")
+    success, _ = http_check("GET", "http://localhost:8000/health", "Testing health")
     
     if success:
         print("   ✅ Health endpoint working")
@@ -214,10 +273,8 @@ def test_fixes():
         return False
     
     print("\n2️⃣ Testing PII detection...")
-    success, output = run_command(
-        'curl -s -X POST http://localhost:8000/test -H "Content-Type: application/json" -d \'{"content": "My name is John Smith"}\'',
-        "Testing PII detection"
-    )
+    success, output = http_check("POST", "http://localhost:8000/test", "Testing PII detection",
+                                 json={"content": "My name is John Smith"})
     
     if success and "redacted" in output.lower():
         print("   ✅ PII detection working")
@@ -225,7 +282,7 @@ def test_fixes():
         print("   ❌ PII detection not working")
     
     print("\n3️⃣ Testing domain authorization...")
-    success, _ = run_command("curl -I http://localhost/health", "Testing via Nginx")
+    success, _ = http_check("HEAD", "http://localhost/health", "Testing via Nginx")
     
     if success:
         print("   ✅ Domain authorization working")
@@ -4,29 +4,97 @@ Fix Streamlit Dashboard - Complete solution for static file issues
 This addresses the 403 Forbidden and MIME type issues with Streamlit dashboard
 """
 
+import io
+import os
+import shlex
 import subprocess
 import sys
+import tarfile
 import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
-def run_command(command, description=""):
-    """Run shell command and return result"""
-    print(f"🔧 {description}")
-    print(f"   Command: {command}")
+from ruamel.yaml import YAML, YAMLError
+from ruamel.yaml.comments import CommentedSeq
+
+DASHBOARD_COMMAND = "streamlit run dashboard.py --server.port=8501 --server.address=0.0.0.0 --server.baseUrlPath=/dashboard"
+# With a base path Streamlit serves its health endpoint under it too
+DASHBOARD_HEALTHCHECK = ["CMD", "curl", "-fsS", "http://localhost:8501/dashboard/_stcore/health"]
+STREAMLIT_VOLUME = "./.streamlit:/app/.streamlit"
+BROTLI_MODULE_CONF = "/usr/share/nginx/modules-available/mod-http-brotli-filter.conf"
+BROTLI_CONFIG = """    brotli on;
+    brotli_comp_level 5;
+    brotli_min_length 1024;
+    brotli_types text/plain text/css application/javascript application/json font/woff2 image/svg+xml;
+"""
+
+def run_command(command, description="", cwd=None):
+    """Run command (split with shlex, no shell) and return result"""
+    # Report is printed in one go so commands run by run_many don't interleave their lines
+    report = [f"🔧 {description}", f"   Command: {command}"]
     
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        result = subprocess.run(shlex.split(command), cwd=cwd, capture_output=True, text=True)
         if result.returncode == 0:
-            print(f"   ✅ Success")
+            report.append(f"   ✅ Success")
             if result.stdout.strip():
-                for line in result.stdout.strip().split('\n')[:3]:
-                    print(f"      {line}")
+                for line in islice(result.stdout.strip().splitlines(), 3):
+                    report.append(f"      {line}")
             return True, result.stdout.strip()
         else:
-            print(f"   ❌ Failed: {result.stderr.strip()}")
+            report.append(f"   ❌ Failed: {result.stderr.strip()}")
             return False, result.stderr.strip()
     except Exception as e:
-        print(f"   ❌ Error: {e}")
+        report.append(f"   ❌ Error: {e}")
+        return False, str(e)
+    finally:
+        print("\n".join(report))
+
+def run_many(commands):
+    """Run independent (command, description) pairs concurrently"""
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        return list(ex.map(lambda c: run_command(*c), commands))
+
+def install_tar(root, files, description=""):
+    """Install {relative path: text} under root with a single in-memory sudo tar -x"""
+    report = [f"🔧 {description}", f"   Extract: {', '.join(files)} -> {root}"]
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tf:
+        for name, text in files.items():
+            data = text.encode()
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tf.addfile(info, io.BytesIO(data))
+    
+    try:
+        result = subprocess.run(["sudo", "tar", "-xC", root, "-f", "-"], input=buf.getvalue(), capture_output=True)
+        if result.returncode == 0:
+            report.append(f"   ✅ Success")
+            return True, ""
+        else:
+            report.append(f"   ❌ Failed: {result.stderr.decode(errors='replace').strip()}")
+            return False, result.stderr.decode(errors='replace').strip()
+    except Exception as e:
+        report.append(f"   ❌ Error: {e}")
         return False, str(e)
+    finally:
+        print("\n".join(report))
+
+def wait_for(url, description, timeout=60):
+    """Poll url with exponential backoff until it answers or timeout expires"""
+    print(f"⏳ Waiting for {description}...")
+    deadline = time.monotonic() + timeout
+    delay = 0.25
+    while time.monotonic() < deadline:
+        result = subprocess.run(["curl", "-fsS", "-o", "/dev/null", url], capture_output=True)
+        if result.returncode == 0:
+            print(f"   ✅ {description} is up")
+            return True
+        time.sleep(delay)
+        delay = min(delay * 1.5, 2.0)
+    print(f"   ❌ {description} not ready after {timeout}s")
+    return False
 
 def fix_streamlit_config():
     """Fix Streamlit configuration for proper static file serving"""
@@ -38,9 +106,6 @@ def fix_streamlit_config():
     
     print("\n2️⃣ Creating Streamlit configuration...")
     
-    # Create Streamlit config directory
-    run_command("mkdir -p /opt/trustlayer-ai/.streamlit", "Creating Streamlit config directory")
-    
     # Create Streamlit config file
     streamlit_config = '''[server]
 port = 8501
@@ -68,43 +133,60 @@ showErrorDetails = true
 level = "info"
 '''
     
-    with open('/tmp/streamlit_config.toml', 'w') as f:
-        f.write(streamlit_config)
-    
-    run_command("sudo cp /tmp/streamlit_config.toml /opt/trustlayer-ai/.streamlit/config.toml", 
-               "Installing Streamlit config")
-    
     print("\n3️⃣ Updating Docker Compose for Streamlit...")
     
-    # Read current docker-compose.yml
+    # Round-trip mode keeps the comments and layout of the user's docker-compose.yml
+    compose_yaml = YAML()
+    compose_yaml.preserve_quotes = True
+    compose_yaml.indent(mapping=2, sequence=4, offset=2)
+    compose_yaml.width = 4096
     try:
         with open('/opt/trustlayer-ai/docker-compose.yml', 'r') as f:
-            docker_compose = f.read()
-    except:
-        print("   ❌ Could not read docker-compose.yml")
+            docker_compose = compose_yaml.load(f)
+        dashboard = docker_compose['services']['dashboard']
+    except (OSError, YAMLError, KeyError, TypeError):
+        print("   ❌ Could not read dashboard service from docker-compose.yml")
         return False
     
-    # Update docker-compose.yml to include Streamlit config
-    updated_compose = docker_compose.replace(
-        'command: streamlit run dashboard.py --server.port=8501 --server.address=0.0.0.0',
-        '''command: streamlit run dashboard.py --server.port=8501 --server.address=0.0.0.0 --server.baseUrlPath=/dashboard
-    volumes:
-      - ./.streamlit:/app/.streamlit'''
-    )
-    
-    with open('/tmp/docker-compose-updated.yml', 'w') as f:
-        f.write(updated_compose)
+    # Point the dashboard at the /dashboard base path and mount the Streamlit config
+    dashboard['command'] = DASHBOARD_COMMAND
+    if 'healthcheck' in dashboard:
+        healthcheck_test = CommentedSeq(DASHBOARD_HEALTHCHECK)
+        healthcheck_test.fa.set_flow_style()
+        dashboard['healthcheck']['test'] = healthcheck_test
+    volumes = dashboard.setdefault('volumes', [])
+    if STREAMLIT_VOLUME not in volumes:
+        volumes.append(STREAMLIT_VOLUME)
     
-    run_command("sudo cp /tmp/docker-compose-updated.yml /opt/trustlayer-ai/docker-compose.yml", 
-               "Updating Docker Compose")
+    buffer = io.StringIO()
+    compose_yaml.dump(docker_compose, buffer)
+    updated_compose = buffer.getvalue()
     
     print("\n4️⃣ Creating comprehensive Nginx configuration...")
     
-    nginx_config = '''server {
+    nginx_config = '''# Content-hashed Streamlit assets (main.77d1c464.css, 123.4f5e6a7b.chunk.js, ...) never
+# change under the same name; anything else under /static/ gets a short, revalidating TTL
+map $uri $static_cache_control {
+    "~*\\.[0-9a-f]{8,}(\\.chunk)?\\.[a-z0-9]+$"  "public, max-age=31536000, immutable";
+    default                                     "public, max-age=600, stale-while-revalidate=86400";
+}
+
+# Edge cache for Streamlit's static bundle, so each asset is fetched from the container once
+proxy_cache_path /var/cache/nginx/streamlit levels=1:2 keys_zone=stcache:50m max_size=500m inactive=7d use_temp_path=off;
+
+server {
     listen 80 default_server;
     listen [::]:80 default_server;
     server_name _;
     
+    # Compress Streamlit's JS/CSS bundles on the way out
+    gzip on;
+    gzip_comp_level 5;
+    gzip_min_length 1024;
+    gzip_proxied any;
+    gzip_vary on;
+    gzip_types text/plain text/css application/javascript application/json font/woff2 image/svg+xml;
+    
     # Security headers
     add_header X-Frame-Options "SAMEORIGIN" always;
     add_header X-Content-Type-Options "nosniff" always;
@@ -147,46 +229,26 @@ level = "info"
         
         # Streamlit specific settings
         proxy_buffering off;
+        proxy_request_buffering off;
         proxy_cache off;
+        tcp_nodelay on;
         proxy_read_timeout 86400;
     }
     
-    # Static files with correct MIME types
+    # Static files - Streamlit already sends the right Content-Type, so pass it through
     location /static/ {
         proxy_pass http://127.0.0.1:8501/static/;
         proxy_set_header Host $host;
         
-        # CSS files
-        location ~* \\.css$ {
-            proxy_pass http://127.0.0.1:8501;
-            proxy_hide_header Content-Type;
-            add_header Content-Type "text/css" always;
-        }
-        
-        # JavaScript files
-        location ~* \\.js$ {
-            proxy_pass http://127.0.0.1:8501;
-            proxy_hide_header Content-Type;
-            add_header Content-Type "application/javascript" always;
-        }
-        
-        # Font files
-        location ~* \\.(woff|woff2|ttf|eot)$ {
-            proxy_pass http://127.0.0.1:8501;
-            proxy_hide_header Content-Type;
-            add_header Content-Type "font/woff2" always;
-        }
-        
-        # Image files
-        location ~* \\.(png|jpg|jpeg|gif|ico|svg)$ {
-            proxy_pass http://127.0.0.1:8501;
-            proxy_hide_header Content-Type;
-            add_header Content-Type "image/png" always;
-        }
+        proxy_cache stcache;
+        proxy_cache_valid 200 302 7d;
+        proxy_cache_use_stale error timeout updating;
+        proxy_cache_lock on;
+        add_header X-Cache $upstream_cache_status always;
         
-        # Cache static files
-        expires 1d;
-        add_header Cache-Control "public, immutable";
+        # Cache static files: a year for hashed names, 10 minutes otherwise (see the map above);
+        # no expires, which would send a second Cache-Control header
+        add_header Cache-Control $static_cache_control always;
     }
     
     # WebSocket endpoint for Streamlit
@@ -201,6 +263,11 @@ level = "info"
         proxy_set_header Upgrade $http_upgrade;
         proxy_set_header Connection "upgrade";
         proxy_read_timeout 86400;
+        
+        # Pass frames through as soon as they arrive
+        proxy_buffering off;
+        proxy_request_buffering off;
+        proxy_cache off;
     }
     
     # Health check endpoint
@@ -229,15 +296,27 @@ level = "info"
     }
 }'''
     
-    # Backup and install new config
-    run_command("sudo cp /etc/nginx/sites-available/default /etc/nginx/sites-available/default.backup.$(date +%Y%m%d_%H%M%S)", 
-               "Backing up Nginx config")
+    # Brotli is only enabled when the distro's module package is (or can be) installed
+    brotli_ok = os.path.exists(BROTLI_MODULE_CONF)
+    if not brotli_ok:
+        brotli_ok, _ = run_command("sudo apt-get update -qq", "Refreshing package index")
+        if brotli_ok:
+            brotli_ok, _ = run_command("sudo apt-get install -y libnginx-mod-http-brotli-filter",
+                                       "Installing Nginx brotli module")
+    if brotli_ok:
+        nginx_config = nginx_config.replace("    # Security headers", BROTLI_CONFIG + "    \n    # Security headers", 1)
     
-    with open('/tmp/nginx_streamlit_fix.conf', 'w') as f:
-        f.write(nginx_config)
+    run_command("sudo mkdir -p /var/cache/nginx/streamlit", "Creating Nginx cache directory")
     
-    run_command("sudo cp /tmp/nginx_streamlit_fix.conf /etc/nginx/sites-available/default", 
-               "Installing new Nginx config")
+    # Backup and install new config
+    backup = f"/etc/nginx/sites-available/default.backup.{time.strftime('%Y%m%d_%H%M%S')}"
+    run_command(f"sudo cp /etc/nginx/sites-available/default {backup}", "Backing up Nginx config")
+    
+    # One sudo tar per target root; tar also creates .streamlit if it is missing
+    install_tar("/opt/trustlayer-ai", {".streamlit/config.toml": streamlit_config,
+                                       "docker-compose.yml": updated_compose},
+                "Installing Streamlit config and Docker Compose")
+    install_tar("/etc/nginx/sites-available", {"default": nginx_config}, "Installing new Nginx config")
     
     print("\n5️⃣ Testing and restarting services...")
     
@@ -245,22 +324,25 @@ level = "info"
     success, output = run_command("sudo nginx -t", "Testing Nginx configuration")
     if not success:
         print("   ❌ Nginx config failed, restoring backup")
-        run_command("sudo cp /etc/nginx/sites-available/default.backup.* /etc/nginx/sites-available/default", 
-                   "Restoring backup")
+        run_command(f"sudo cp {backup} /etc/nginx/sites-available/default", "Restoring backup")
         return False
     
     # Restart Nginx
     run_command("sudo systemctl restart nginx", "Restarting Nginx")
     
     # Start Docker services
-    run_command("cd /opt/trustlayer-ai && docker-compose up -d", "Starting Docker services")
+    run_command("docker-compose up -d", "Starting Docker services", cwd="/opt/trustlayer-ai")
     
     print("\n6️⃣ Waiting for services to start...")
-    time.sleep(15)
+    if not (wait_for("http://127.0.0.1:8000/health", "TrustLayer proxy") and
+            wait_for("http://127.0.0.1:8501/dashboard/_stcore/health", "Streamlit dashboard")):
+        return False
     
     print("\n7️⃣ Testing dashboard access...")
-    run_command("curl -I http://localhost/dashboard/", "Testing dashboard")
-    run_command("curl -I http://localhost/static/css/main.77d1c464.css", "Testing CSS file")
+    run_many([
+        ("curl -I http://localhost/dashboard/", "Testing dashboard"),
+        ("curl -I http://localhost/static/css/main.77d1c464.css", "Testing CSS file"),
+    ])
     
     print("\n" + "=" * 60)
     print("🎉 STREAMLIT DASHBOARD FIX COMPLETE!")
@@ -277,7 +359,7 @@ def create_simple_dashboard():
 import requests
 import json
 from datetime import datetime
-import time
+from streamlit_autorefresh import st_autorefresh
 
 # Configure Streamlit page
 st.set_page_config(
@@ -302,6 +384,7 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_data(ttl=5, show_spinner=False)
 def get_metrics():
     """Get metrics from TrustLayer AI"""
     try:
@@ -375,9 +458,8 @@ def main():
         except Exception as e:
             st.error(f"Test error: {e}")
     
-    # Auto-refresh
-    time.sleep(5)
-    st.rerun()
+    # Auto-refresh from the browser instead of parking a script thread in sleep
+    st_autorefresh(interval=5000, key="mref")
 
 if __name__ == "__main__":
     main()
@@ -391,7 +473,7 @@ if __name__ == "__main__":
                "Installing simple dashboard")
     
     # Update docker-compose to use simple dashboard
-    simple_compose = '''version: '3.8'
+    simple_compose = '''version: '3.9'
 
 services:
   proxy:
@@ -401,9 +483,16 @@ services:
     environment:
       - REDIS_URL=redis://redis:6379
     depends_on:
-      - redis
+      redis:
+        condition: service_healthy
     restart: unless-stopped
     container_name: trustlayer-proxy
+    healthcheck:
+      test: ["CMD", "curl", "-fsS", "http://localhost:8000/health"]
+      interval: 5s
+      timeout: 2s
+      retries: 10
+      start_period: 20s
 
   dashboard:
     build: .
@@ -411,7 +500,8 @@ services:
       - "8501:8501"
     command: streamlit run simple_dashboard.py --server.port=8501 --server.address=0.0.0.0
     depends_on:
-      - proxy
+      proxy:
+        condition: service_healthy
     restart: unless-stopped
     container_name: trustlayer-dashboard
 
@@ -421,6 +511,11 @@ services:
       - "6379:6379"
     restart: unless-stopped
     container_name: trustlayer-redis
+    healthcheck:
+      test: ["CMD", "redis-cli", "ping"]
+      interval: 5s
+      timeout: 2s
+      retries: 10
 '''
     
     with open('/tmp/simple_compose.yml', 'w') as f:
@@ -3,9 +3,12 @@
 Fix Streamlit Deployment - Complete solution for static file and MIME type issues
 """
 
+import gzip
 import subprocess
 import sys
 
+from tl_fixops.nginx import render_config
+
 def run_command(command, description=""):
     """Run shell command and return result"""
     print(f"🔧 {description}")
@@ -145,20 +148,32 @@ def create_simple_dashboard():
     </div>
 
     <script>
-        // Check service status
+        // Show service status
+        function setStatus(online) {
+            document.getElementById('status').textContent = online ? '🟢 Online' : '🔴 Offline';
+            document.getElementById('status').className = online ? 'status online' : 'status offline';
+        }
+        
+        // Render metrics summary
+        function renderMetrics(summary) {
+            document.getElementById('totalRequests').textContent = summary.total_requests || 0;
+            document.getElementById('piiBlocked').textContent = summary.total_pii_entities_blocked || 0;
+            document.getElementById('avgLatency').textContent = (summary.avg_latency_ms || 0).toFixed(1) + 'ms';
+            document.getElementById('compliance').textContent = (summary.compliance_score || 100).toFixed(1) + '%';
+        }
+        
+        // Check service status (polling fallback for browsers without EventSource)
         async function checkStatus() {
             try {
                 const response = await fetch('/health');
                 if (response.ok) {
-                    document.getElementById('status').textContent = '🟢 Online';
-                    document.getElementById('status').className = 'status online';
+                    setStatus(true);
                     loadMetrics();
                 } else {
                     throw new Error('Service unavailable');
                 }
             } catch (error) {
-                document.getElementById('status').textContent = '🔴 Offline';
-                document.getElementById('status').className = 'status offline';
+                setStatus(false);
             }
         }
         
@@ -168,12 +183,7 @@ def create_simple_dashboard():
                 const response = await fetch('/metrics');
                 if (response.ok) {
                     const data = await response.json();
-                    const summary = data.summary || {};
-                    
-                    document.getElementById('totalRequests').textContent = summary.total_requests || 0;
-                    document.getElementById('piiBlocked').textContent = summary.total_pii_entities_blocked || 0;
-                    document.getElementById('avgLatency').textContent = (summary.avg_latency_ms || 0).toFixed(1) + 'ms';
-                    document.getElementById('compliance').textContent = (summary.compliance_score || 100).toFixed(1) + '%';
+                    renderMetrics(data.summary || {});
                 }
             } catch (error) {
                 console.error('Failed to load metrics:', error);
@@ -216,13 +226,20 @@ def create_simple_dashboard():
             }
         }
         
-        // Auto-refresh every 30 seconds
-        setInterval(() => {
+        // Metrics are pushed by the dashboard server whenever they change
+        if (window.EventSource) {
+            const es = new EventSource('/metrics/stream');
+            es.onmessage = (event) => {
+                setStatus(true);
+                renderMetrics(JSON.parse(event.data).summary || {});
+            };
+            es.addEventListener('offline', () => setStatus(false));
+            // Streams end every few minutes and reconnect; only a closed source means offline
+            es.onerror = () => { if (es.readyState === EventSource.CLOSED) setStatus(false); };
+        } else {
+            setInterval(checkStatus, 30000);
             checkStatus();
-        }, 30000);
-        
-        // Initial load
-        checkStatus();
+        }
     </script>
 </body>
 </html>'''
@@ -232,6 +249,13 @@ def create_simple_dashboard():
     
     run_command("sudo cp /tmp/dashboard.html /opt/trustlayer-ai/dashboard.html", "Installing HTML dashboard")
     
+    # Nginx serves the page itself; the .gz copy is picked up by gzip_static
+    with open('/tmp/dashboard.html.gz', 'wb') as f:
+        f.write(gzip.compress(html_dashboard.encode(), 9, mtime=0))
+    
+    run_command("sudo mkdir -p /var/www/html", "Creating web directory")
+    run_command("sudo cp /tmp/dashboard.html /tmp/dashboard.html.gz /var/www/html/", "Publishing dashboard to Nginx")
+    
     return True
 
 def create_flask_dashboard():
@@ -245,18 +269,25 @@ Flask Dashboard for TrustLayer AI
 Simple HTML dashboard that works without Streamlit static file issues
 """
 
-from flask import Flask, render_template_string, jsonify, request, send_from_directory
+from flask import Flask, Response, render_template_string, jsonify, request, send_from_directory
 import requests
+from requests.adapters import HTTPAdapter
+import json
 import os
+import threading
+import time
 
 app = Flask(__name__)
 
-# Read the HTML template
+# One keep-alive pool to the proxy instead of a new connection per request
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=0))
+
+# Nginx serves dashboard.html at /dashboard; this copy keeps direct :8501 access working
 with open('dashboard.html', 'r') as f:
     DASHBOARD_HTML = f.read()
 
 @app.route('/')
-@app.route('/dashboard')
 def dashboard():
     """Serve the main dashboard"""
     return DASHBOARD_HTML
@@ -265,7 +296,7 @@ def dashboard():
 def health():
     """Proxy health check to main service"""
     try:
-        response = requests.get('http://localhost:8000/health', timeout=5)
+        response = SESSION.get('http://localhost:8000/health', timeout=(1, 5))
         return response.json(), response.status_code
     except:
         return {"status": "error", "message": "Proxy service unavailable"}, 503
@@ -274,7 +305,7 @@ def health():
 def metrics():
     """Proxy metrics to main service"""
     try:
-        response = requests.get('http://localhost:8000/metrics', timeout=5)
+        response = SESSION.get('http://localhost:8000/metrics', timeout=(1, 5))
         return response.json(), response.status_code
     except:
         return {
@@ -286,17 +317,89 @@ def metrics():
             }
         }, 200
 
+# One poller thread per worker fetches the proxy metrics while anyone is watching and
+# wakes every open stream on a change, so proxy load doesn't grow with the viewer count
+METRICS = {'version': 0, 'payload': None, 'viewers': 0}
+METRICS_CHANGED = threading.Condition()
+POLL_SECONDS = 2
+
+def poll_metrics():
+    """Refresh METRICS from the proxy every POLL_SECONDS while streams are open"""
+    while True:
+        with METRICS_CHANGED:
+            METRICS_CHANGED.wait_for(lambda: METRICS['viewers'] > 0)
+        try:
+            payload = json.dumps(SESSION.get('http://localhost:8000/metrics', timeout=(1, 5)).json())
+        except Exception:
+            payload = None
+        with METRICS_CHANGED:
+            if payload != METRICS['payload'] or METRICS['version'] == 0:
+                METRICS['payload'] = payload
+                METRICS['version'] += 1
+                METRICS_CHANGED.notify_all()
+        time.sleep(POLL_SECONDS)
+
+threading.Thread(target=poll_metrics, daemon=True).start()
+
+# An idle stream only parks a gthread thread on the condition; the cap still leaves
+# threads free for /health, /metrics and /test, and streams rotate after STREAM_SECONDS
+STREAM_SLOTS = threading.BoundedSemaphore(24)
+STREAM_SECONDS = 300
+
+@app.route('/metrics/stream')
+def metrics_stream():
+    """Push proxy metrics to the browser as server-sent events when they change"""
+    def events():
+        if not STREAM_SLOTS.acquire(blocking=False):
+            # All slots busy: EventSource reconnects after the retry delay
+            yield 'retry: 10000\\n\\n'
+            return
+        with METRICS_CHANGED:
+            METRICS['viewers'] += 1
+            METRICS_CHANGED.notify_all()
+        try:
+            yield 'retry: 2000\\n\\n'
+            seen = None
+            deadline = time.monotonic() + STREAM_SECONDS
+            while time.monotonic() < deadline:
+                with METRICS_CHANGED:
+                    METRICS_CHANGED.wait_for(lambda: METRICS['version'] not in (0, seen), timeout=15)
+                    version, payload = METRICS['version'], METRICS['payload']
+                if version in (0, seen):
+                    # Comment line: keeps idle connections open and notices closed tabs
+                    yield ': ping\\n\\n'
+                elif payload is None:
+                    yield 'event: offline\\ndata: {}\\n\\n'
+                else:
+                    yield f'data: {payload}\\n\\n'
+                seen = version
+        finally:
+            with METRICS_CHANGED:
+                METRICS['viewers'] -= 1
+            STREAM_SLOTS.release()
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.after_request
+def disable_proxy_buffering(response):
+    """Ask any nginx in front of us not to buffer the live health/metrics responses"""
+    if request.path in ('/health', '/metrics'):
+        response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/test', methods=['POST'])
 def test_pii():
     """Proxy PII test to main service"""
     try:
-        response = requests.post('http://localhost:8000/test', 
-                               json=request.json, 
-                               timeout=10)
+        response = SESSION.post('http://localhost:8000/test',
+                               json=request.json,
+                               timeout=(1, 10))
         return response.json(), response.status_code
     except:
         return {"error": "PII detection service unavailable"}, 503
 
+# The container serves this with gunicorn; this is only for running it by hand
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8501, debug=False)
 '''
@@ -313,7 +416,7 @@ def update_docker_compose():
     print("\n🔧 Updating Docker Compose for Flask Dashboard")
     print("=" * 45)
     
-    docker_compose = '''version: '3.8'
+    docker_compose = '''version: '3.9'
 
 services:
   proxy:
@@ -324,10 +427,17 @@ services:
       - REDIS_URL=redis://redis:6379
       - PYTHONPATH=/app
     depends_on:
-      - redis
+      redis:
+        condition: service_healthy
     restart: unless-stopped
     container_name: trustlayer-proxy
     command: ["python", "-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000"]
+    healthcheck:
+      test: ["CMD", "curl", "-fsS", "http://localhost:8000/health"]
+      interval: 5s
+      timeout: 2s
+      retries: 10
+      start_period: 20s
 
   dashboard:
     build: .
@@ -336,10 +446,17 @@ services:
     environment:
       - PYTHONPATH=/app
     depends_on:
-      - proxy
+      proxy:
+        condition: service_healthy
     restart: unless-stopped
     container_name: trustlayer-dashboard
-    command: ["python", "flask_dashboard.py"]
+    command: ["gunicorn", "-k", "gthread", "-w", "2", "--threads", "32", "-b", "0.0.0.0:8501", "--keep-alive", "75", "flask_dashboard:app"]
+    # Overrides the image HEALTHCHECK, which probes the proxy port
+    healthcheck:
+      test: ["CMD", "curl", "-fsS", "-o", "/dev/null", "http://localhost:8501/metrics"]
+      interval: 10s
+      timeout: 2s
+      retries: 3
 
   redis:
     image: redis:7-alpine
@@ -347,6 +464,11 @@ services:
       - "6379:6379"
     restart: unless-stopped
     container_name: trustlayer-redis
+    healthcheck:
+      test: ["CMD", "redis-cli", "ping"]
+      interval: 5s
+      timeout: 2s
+      retries: 10
 '''
     
     with open('/tmp/docker-compose-flask.yml', 'w') as f:
@@ -357,32 +479,55 @@ services:
     
     return True
 
+def update_nginx_config():
+    """Point Nginx's /dashboard at the static HTML page"""
+    print("\n🔧 Serving Dashboard HTML from Nginx")
+    print("=" * 35)
+    
+    with open('/tmp/nginx_dashboard_html.conf', 'w') as f:
+        f.write(render_config("html", favicon=True, metrics_stream=True))
+    
+    run_command("sudo cp /tmp/nginx_dashboard_html.conf /etc/nginx/sites-available/default", "Installing HTML Nginx config")
+    
+    success, _ = run_command("sudo nginx -t", "Testing Nginx config")
+    if not success:
+        return False
+    
+    success, _ = run_command("sudo nginx -s reload", "Reloading Nginx")
+    return success
+
 def update_dockerfile():
     """Update Dockerfile to include Flask"""
     print("\n🔧 Updating Dockerfile for Flask")
     print("=" * 30)
     
-    dockerfile = '''FROM python:3.11-slim
+    dockerfile = '''# Build stage: compilers and wheels stay out of the runtime image
+FROM python:3.11-slim AS builder
 
-WORKDIR /app
+ENV PIP_NO_CACHE_DIR=1 PIP_DISABLE_PIP_VERSION_CHECK=1
 
-# Install system dependencies
-RUN apt-get update && apt-get install -y \\
+RUN apt-get update && apt-get install -y --no-install-recommends \\
     gcc \\
     g++ \\
-    curl \\
     && rm -rf /var/lib/apt/lists/*
 
-# Copy requirements and install Python dependencies
+# Python dependencies, Flask for the dashboard and the spaCy model wheel in one prefix
 COPY requirements.txt .
-RUN pip install --no-cache-dir -r requirements.txt
+RUN pip install --prefix=/install -r requirements.txt flask \\
+    https://github.com/explosion/spacy-models/releases/download/en_core_web_sm-3.7.1/en_core_web_sm-3.7.1-py3-none-any.whl
 
-# Install Flask for dashboard
-RUN pip install flask
+# Runtime stage
+FROM python:3.11-slim
 
-# Download spaCy model
-RUN python -m spacy download en_core_web_sm || \\
-    pip install https://github.com/explosion/spacy-models/releases/download/en_core_web_sm-3.7.1/en_core_web_sm-3.7.1-py3-none-any.whl
+ENV PIP_NO_CACHE_DIR=1 PIP_DISABLE_PIP_VERSION_CHECK=1
+
+WORKDIR /app
+
+# curl is used by the compose healthchecks
+RUN apt-get update && apt-get install -y --no-install-recommends curl \\
+    && rm -rf /var/lib/apt/lists/*
+
+COPY --from=builder /install /usr/local
 
 # Copy application code
 COPY . .
@@ -394,6 +539,8 @@ USER appuser
 # Expose ports
 EXPOSE 8000 8501
 
+HEALTHCHECK CMD curl -fsS http://localhost:8000/health || exit 1
+
 # Default command
 CMD ["python", "-m", "uvicorn", "app.main:app", "--host", "0.0.0.0", "--port", "8000"]
 '''
@@ -433,6 +580,10 @@ def main():
         print("❌ Failed to update docker-compose")
         return
     
+    if not update_nginx_config():
+        print("❌ Failed to update Nginx config")
+        return
+    
     print("\n" + "=" * 50)
     print("🎉 STREAMLIT DEPLOYMENT FIX COMPLETE!")
     print("=" * 50)
@@ -4,86 +4,173 @@ Open Port 8000 for External Access
 Creates firewall rule to allow external access to TrustLayer AI on port 8000
 """
 
+import shlex
 import subprocess
 import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import google.auth
+    from google.api_core.exceptions import Conflict
+    from google.cloud import compute_v1
+except ImportError:
+    compute_v1 = None
+
+OUTPUT_TAIL_LINES = 20
+PREVIEW_LINES = 3
+
+VM_NAME = "trustlayer-ai-main"
+ZONE = "us-central1-a"
+NETWORK = "vpc-trustlayer"
+TAG = "trustlayer-web"
+FIREWALL_RULES = [
+    ("trustlayer-port-8000", 8000, "Allow external access to TrustLayer AI port 8000"),
+    ("trustlayer-port-8501", 8501, "Allow external access to TrustLayer AI dashboard port 8501"),
+]
 
 def run_command(command, description=""):
-    """Run shell command and return result"""
-    print(f"🔧 {description}")
-    print(f"   Command: {command}")
+    """Run command (argv list, or a string split with shlex; no shell) and return result"""
+    argv = shlex.split(command) if isinstance(command, str) else command
+    # Report is printed in one go so concurrent gcloud calls don't interleave their lines
+    report = [f"🔧 {description}", f"   Command: {shlex.join(argv)}"]
     
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
-        if result.returncode == 0:
-            print(f"   ✅ Success")
-            if result.stdout.strip():
-                for line in result.stdout.strip().split('\n')[:3]:
-                    print(f"      {line}")
-            return True, result.stdout.strip()
+        # Output is read line by line; only a short preview and a bounded tail are kept
+        preview = []
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        with subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True) as proc:
+            for line in proc.stdout:
+                line = line.rstrip("\n")
+                if len(preview) < PREVIEW_LINES and line.strip():
+                    preview.append(line)
+                tail.append(line)
+        output = "\n".join(tail).strip()
+        if proc.returncode == 0:
+            report.append(f"   ✅ Success")
+            for line in preview:
+                report.append(f"      {line}")
+            return True, output
         else:
-            print(f"   ❌ Failed: {result.stderr.strip()}")
-            return False, result.stderr.strip()
+            report.append(f"   ❌ Failed: {output}")
+            return False, output
     except Exception as e:
-        print(f"   ❌ Error: {e}")
+        report.append(f"   ❌ Error: {e}")
         return False, str(e)
+    finally:
+        print("\n".join(report))
 
-def open_port_8000():
-    """Open port 8000 for external access"""
-    print("🚀 Opening Port 8000 for External Access")
-    print("=" * 50)
+def create_rule_api(firewalls, project, name, port, description):
+    """Insert one ingress rule via the Compute API, treating an existing rule as success"""
+    rule = compute_v1.Firewall(
+        name=name, network=f"projects/{project}/global/networks/{NETWORK}", direction="INGRESS",
+        priority=1000, allowed=[compute_v1.Allowed(I_p_protocol="tcp", ports=[str(port)])],
+        source_ranges=["0.0.0.0/0"], target_tags=[TAG], description=description)
+    try:
+        firewalls.insert(project=project, firewall_resource=rule).result()
+        return True, f"   ✅ Created firewall rule {name}"
+    except Conflict:
+        return True, f"   ✅ Rule {name} already exists - that's fine"
+    except Exception as e:
+        return False, f"   ❌ Failed to create {name}: {e}"
+
+def open_ports_api():
+    """Create the rules and check the VM tag through the Compute SDK (no gcloud processes)"""
+    credentials, project = google.auth.default()
+    firewalls = compute_v1.FirewallsClient(credentials=credentials)
+    instances = compute_v1.InstancesClient(credentials=credentials)
+    
+    print("\n1️⃣ Creating firewall rules and checking VM network tags via the Compute API...")
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        creates = [pool.submit(create_rule_api, firewalls, project, *rule) for rule in FIREWALL_RULES]
+        get_vm = pool.submit(instances.get, project=project, zone=ZONE, instance=VM_NAME)
+    
+    print("\n2️⃣ Checking firewall rule results...")
+    results = [future.result() for future in creates]
+    for _, message in results:
+        print(message)
+    
+    print("\n3️⃣ Checking VM network tags...")
+    instance = get_vm.result()
+    if TAG in instance.tags.items:
+        print(f"   ✅ VM has {TAG} tag")
+    else:
+        print(f"   ⚠️  VM missing {TAG} tag - adding it...")
+        tags = compute_v1.Tags(items=[*instance.tags.items, TAG], fingerprint=instance.tags.fingerprint)
+        instances.set_tags(project=project, zone=ZONE, instance=VM_NAME, tags_resource=tags).result()
+        print(f"   ✅ Added {TAG} tag to VM")
+    
+    print("\n4️⃣ Listing all TrustLayer firewall rules...")
+    for rule in firewalls.list(project=project, filter="name eq trustlayer.*"):
+        allowed = ",".join(f"{a.I_p_protocol}:{'/'.join(a.ports)}" for a in rule.allowed)
+        print(f"   {rule.name:<28} {allowed:<12} {','.join(rule.source_ranges):<12} {','.join(rule.target_tags)}")
     
-    # Step 1: Create firewall rule for port 8000
-    print("\n1️⃣ Creating firewall rule for port 8000...")
-    command = '''gcloud compute firewall-rules create trustlayer-port-8000 \
-    --network vpc-trustlayer \
-    --action ALLOW \
-    --rules tcp:8000 \
-    --source-ranges 0.0.0.0/0 \
-    --target-tags trustlayer-web \
-    --description "Allow external access to TrustLayer AI port 8000" \
-    --priority 1000'''
-    
-    success, output = run_command(command, "Creating firewall rule for port 8000")
-    
-    if not success and "already exists" in output:
-        print("   ✅ Rule already exists - that's fine")
-        success = True
-    
-    # Step 2: Create firewall rule for port 8501 (dashboard)
-    print("\n2️⃣ Creating firewall rule for port 8501...")
-    command2 = '''gcloud compute firewall-rules create trustlayer-port-8501 \
-    --network vpc-trustlayer \
-    --action ALLOW \
-    --rules tcp:8501 \
-    --source-ranges 0.0.0.0/0 \
-    --target-tags trustlayer-web \
-    --description "Allow external access to TrustLayer AI dashboard port 8501" \
-    --priority 1000'''
-    
-    success2, output2 = run_command(command2, "Creating firewall rule for port 8501")
-    
-    if not success2 and "already exists" in output2:
-        print("   ✅ Rule already exists - that's fine")
-        success2 = True
+    return all(success for success, _ in results)
+
+def firewall_create_command(name, port, description):
+    """gcloud argv creating one ingress rule for port"""
+    return ["gcloud", "compute", "firewall-rules", "create", name,
+            f"--network={NETWORK}", "--action=ALLOW", f"--rules=tcp:{port}",
+            "--source-ranges=0.0.0.0/0", f"--target-tags={TAG}",
+            f"--description={description}", "--priority=1000"]
+
+def open_ports_gcloud():
+    """Create the rules and check the VM tag with the gcloud CLI"""
+    vm_command = ["gcloud", "compute", "instances", "describe", VM_NAME, f"--zone={ZONE}",
+                  "--format=value(tags.items)"]
+    
+    # The two creates and the tag lookup are independent, so run them side by side
+    print("\n1️⃣ Creating firewall rules and checking VM network tags...")
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        creates = [(port, pool.submit(run_command, firewall_create_command(name, port, description),
+                                      f"Creating firewall rule for port {port}"))
+                   for name, port, description in FIREWALL_RULES]
+        describe_vm = pool.submit(run_command, vm_command, "Getting VM network tags")
+    
+    # Step 2: Firewall rule results
+    print("\n2️⃣ Checking firewall rule results...")
+    all_created = True
+    for port, future in creates:
+        success, output = future.result()
+        if not success and "already exists" in output:
+            print(f"   ✅ Rule for port {port} already exists - that's fine")
+            success = True
+        all_created = all_created and success
     
     # Step 3: Verify VM has the correct network tags
     print("\n3️⃣ Checking VM network tags...")
-    vm_command = 'gcloud compute instances describe trustlayer-ai-main --zone=us-central1-a --format="value(tags.items)"'
-    success3, tags = run_command(vm_command, "Getting VM network tags")
+    success3, tags = describe_vm.result()
     
     if success3:
-        if "trustlayer-web" in tags:
-            print("   ✅ VM has trustlayer-web tag")
+        if TAG in tags:
+            print(f"   ✅ VM has {TAG} tag")
         else:
-            print("   ⚠️  VM missing trustlayer-web tag - adding it...")
-            add_tag_command = 'gcloud compute instances add-tags trustlayer-ai-main --tags trustlayer-web --zone us-central1-a'
-            run_command(add_tag_command, "Adding trustlayer-web tag to VM")
+            print(f"   ⚠️  VM missing {TAG} tag - adding it...")
+            add_tag_command = ["gcloud", "compute", "instances", "add-tags", VM_NAME, f"--tags={TAG}", f"--zone={ZONE}"]
+            run_command(add_tag_command, f"Adding {TAG} tag to VM")
     
     # Step 4: List all TrustLayer firewall rules
     print("\n4️⃣ Listing all TrustLayer firewall rules...")
-    list_command = 'gcloud compute firewall-rules list --filter="name~trustlayer" --format="table(name,allowed,sourceRanges,targetTags)"'
+    list_command = ["gcloud", "compute", "firewall-rules", "list", "--filter=name~trustlayer",
+                    "--format=table(name,allowed,sourceRanges,targetTags)"]
     run_command(list_command, "Listing TrustLayer firewall rules")
     
+    return all_created
+
+def open_port_8000():
+    """Open port 8000 for external access"""
+    print("🚀 Opening Port 8000 for External Access")
+    print("=" * 50)
+    
+    success = None
+    if compute_v1 is not None:
+        try:
+            success = open_ports_api()
+        except Exception as e:
+            print(f"   ⚠️  Compute API unavailable ({e}), falling back to gcloud")
+    if success is None:
+        success = open_ports_gcloud()
+    
     print("\n" + "=" * 50)
     print("🎉 PORT 8000 SHOULD NOW BE ACCESSIBLE!")
     print("=" * 50)
@@ -102,7 +189,7 @@ def open_port_8000():
     
     print("\n⏳ Wait 1-2 minutes for firewall rules to propagate, then test!")
     
-    return success and success2
+    return success
 
 if __name__ == "__main__":
     success = open_port_8000()
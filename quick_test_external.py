@@ -3,68 +3,118 @@
 Quick External IP Test - Simple 4-step connectivity test
 """
 
-import socket
+import argparse
+import atexit
+import json
+import os
 import requests
-import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Only 502/503/504 are retried; connect and read errors surface as-is so check_http can
+# tell "TCP failed" from "TCP ok, no HTTP answer", and the last bad status is returned
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=4,
+                                     max_retries=Retry(total=2, connect=0, read=False, backoff_factor=0.3,
+                                                       status_forcelist=[502, 503, 504],
+                                                       raise_on_status=False)))
+atexit.register(SESSION.close)
+
+# (connect, read) seconds for each HTTP probe
+PROBE_TIMEOUT = (3, 10)
+
+# Fully passing results are replayed for a short while, e.g. when re-running during propagation waits
+PROBE_CACHE_DIR = os.path.expanduser("~/.cache/trustlayer")
+PROBE_CACHE_TTL = 30
 
 def log(message):
     timestamp = datetime.now().strftime("%H:%M:%S")
     print(f"[{timestamp}] {message}")
 
-def test_external_ip(ip):
-    log(f"🧪 Quick Test for External IP: {ip}")
-    log("=" * 50)
-    
-    # Test 1: Basic TCP connectivity
-    log("1️⃣ Testing TCP connection to port 8000...")
+def probe_cache_path(ip):
+    """Path of the cached probe results for one IP"""
+    return os.path.join(PROBE_CACHE_DIR, f"probe_{ip}.json")
+
+def read_probe_cache(ip):
+    """Return (age, results) if cached results are younger than PROBE_CACHE_TTL, else None"""
+    path = probe_cache_path(ip)
     try:
-        sock = socket.create_connection((ip, 8000), timeout=10)
-        sock.close()
-        log("   ✅ TCP connection successful")
-        tcp_works = True
-    except Exception as e:
-        log(f"   ❌ TCP connection failed: {e}")
-        tcp_works = False
-    
-    # Test 2: HTTP health check
-    log("2️⃣ Testing HTTP health endpoint...")
+        age = time.time() - os.path.getmtime(path)
+        if age < PROBE_CACHE_TTL:
+            with open(path) as f:
+                return age, json.load(f)
+    except (OSError, ValueError):
+        pass
+    return None
+
+def write_probe_cache(ip, results):
+    """Store probe results atomically so a concurrent run never reads half a file"""
     try:
-        response = requests.get(f"http://{ip}:8000/health", timeout=10)
-        if response.status_code == 200:
-            log(f"   ✅ Health check successful: {response.json()}")
-            health_works = True
-        else:
-            log(f"   ❌ Health check failed: HTTP {response.status_code}")
-            health_works = False
-    except Exception as e:
-        log(f"   ❌ Health check error: {e}")
-        health_works = False
-    
-    # Test 3: Dashboard port
-    log("3️⃣ Testing dashboard port 8501...")
+        os.makedirs(PROBE_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=PROBE_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(results, f)
+        os.replace(tmp_path, probe_cache_path(ip))
+    except OSError:
+        pass
+
+def check_http(url, name, show_json=False):
+    """GET url and return (tcp_ok, http_ok, messages); TCP reachability comes from the connect phase"""
     try:
-        sock = socket.create_connection((ip, 8501), timeout=10)
-        sock.close()
-        log("   ✅ Dashboard port accessible")
-        dashboard_tcp = True
-    except Exception as e:
-        log(f"   ❌ Dashboard port failed: {e}")
-        dashboard_tcp = False
+        response = SESSION.get(url, timeout=PROBE_TIMEOUT)
+    except requests.exceptions.ConnectionError as e:
+        return False, False, [f"   ❌ TCP connection failed: {e}"]
+    except requests.exceptions.RequestException as e:
+        return True, False, ["   ✅ TCP connection successful", f"   ❌ {name} error: {e}"]
     
-    # Test 4: Dashboard HTTP
-    log("4️⃣ Testing dashboard HTTP...")
+    tcp_ok = "   ✅ TCP connection successful"
+    if response.status_code != 200:
+        return True, False, [tcp_ok, f"   ❌ {name} failed: HTTP {response.status_code}"]
     try:
-        response = requests.get(f"http://{ip}:8501", timeout=10)
-        if response.status_code == 200:
-            log("   ✅ Dashboard HTTP successful")
-            dashboard_http = True
-        else:
-            log(f"   ❌ Dashboard HTTP failed: HTTP {response.status_code}")
-            dashboard_http = False
-    except Exception as e:
-        log(f"   ❌ Dashboard HTTP error: {e}")
-        dashboard_http = False
+        detail = f": {response.json()}" if show_json else ""
+    except ValueError:
+        detail = ""
+    return True, True, [tcp_ok, f"   ✅ {name} successful{detail}"]
+
+def run_probes(ip):
+    """Probe both ports and return [tcp 8000, health, tcp 8501, dashboard HTTP]"""
+    probes = [
+        ("1️⃣ Testing port 8000 (TCP + health endpoint)...",
+         (f"http://{ip}:8000/health", "Health check", True)),
+        ("2️⃣ Testing port 8501 (TCP + dashboard HTTP)...",
+         (f"http://{ip}:8501", "Dashboard HTTP")),
+    ]
+    
+    # Probes are independent, so the slowest one (not their sum) bounds the wait
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(check_http, *args) for _, args in probes]
+    
+    results = []
+    for (heading, _), future in zip(probes, futures):
+        tcp_ok, http_ok, messages = future.result()
+        log(heading)
+        for message in messages:
+            log(message)
+        results.extend([tcp_ok, http_ok])
+    return results
+
+def test_external_ip(ip, refresh=False):
+    log(f"🧪 Quick Test for External IP: {ip}")
+    log("=" * 50)
+    
+    cached = None if refresh else read_probe_cache(ip)
+    if cached is not None:
+        age, results = cached
+        log(f"♻️  All checks passed {age:.0f}s ago - reusing those results (--refresh to re-probe)")
+    else:
+        results = run_probes(ip)
+        if all(results):
+            write_probe_cache(ip, results)
+    tcp_works, health_works, dashboard_tcp, dashboard_http = results
     
     # Summary
     log("=" * 50)
@@ -97,10 +147,10 @@ def test_external_ip(ip):
         log("   Check VM services and firewall configuration")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python quick_test_external.py <EXTERNAL_IP>")
-        print("Example: python quick_test_external.py 34.59.4.137")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Quick external connectivity test",
+                                     epilog="Example: python quick_test_external.py 34.59.4.137")
+    parser.add_argument("ip", metavar="EXTERNAL_IP")
+    parser.add_argument("--refresh", action="store_true", help="ignore results cached by a recent passing run")
+    args = parser.parse_args()
     
-    ip = sys.argv[1]
-    test_external_ip(ip)
\ No newline at end of file
+    test_external_ip(args.ip, args.refresh)
\ No newline at end of file
@@ -0,0 +1,14 @@
+import time
+
+import pytest
+import requests
+
+import fix_external_access
+
+def test_hanging_port_is_a_timeout_not_a_connection_error(hanging_port):
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout) as excinfo:
+        fix_external_access.SESSION.get(f"http://127.0.0.1:{hanging_port}/health", timeout=1)
+    assert not isinstance(excinfo.value, requests.exceptions.ConnectionError)
+    # One read timeout, not one per retry
+    assert time.monotonic() - start < 2.5
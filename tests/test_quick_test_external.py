@@ -0,0 +1,40 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import quick_test_external
+
+class BadGateway(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(502)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+    
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def bad_gateway_port():
+    """A local HTTP server that answers every GET with 502"""
+    server = HTTPServer(("127.0.0.1", 0), BadGateway)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+def test_hanging_port_is_tcp_ok_http_failed(hanging_port, monkeypatch):
+    monkeypatch.setattr(quick_test_external, "PROBE_TIMEOUT", (1, 1))
+    tcp_ok, http_ok, messages = quick_test_external.check_http(f"http://127.0.0.1:{hanging_port}/health", "Health check")
+    assert (tcp_ok, http_ok) == (True, False)
+    assert "TCP connection successful" in messages[0]
+
+def test_bad_gateway_reports_http_status(bad_gateway_port):
+    tcp_ok, http_ok, messages = quick_test_external.check_http(f"http://127.0.0.1:{bad_gateway_port}/health", "Health check")
+    assert (tcp_ok, http_ok) == (True, False)
+    assert "failed: HTTP 502" in messages[-1]
+
+def test_closed_port_is_tcp_failed():
+    tcp_ok, http_ok, messages = quick_test_external.check_http("http://127.0.0.1:1/health", "Health check")
+    assert (tcp_ok, http_ok) == (False, False)
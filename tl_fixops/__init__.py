@@ -0,0 +1 @@
+# TrustLayer AI fix-script helpers
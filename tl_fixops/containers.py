@@ -0,0 +1,40 @@
+"""
+TrustLayer AI: Docker container helpers shared by the VM fix scripts
+"""
+import asyncio
+import time
+
+async def wait_healthy(containers, timeout=45):
+    """Block on Docker health_status events until every container is healthy"""
+    deadline = time.monotonic() + timeout
+    events = await asyncio.create_subprocess_exec(
+        "docker", "events", "--filter", "event=health_status",
+        "--format", "{{.Actor.Attributes.name}} {{.Status}}",
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+    try:
+        # Containers that are already healthy, or have no healthcheck, emit no event
+        inspect = await asyncio.create_subprocess_exec(
+            "docker", "inspect", "--format",
+            "{{.Name}} {{if .State.Health}}{{.State.Health.Status}}{{else}}none{{end}}",
+            *containers, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL)
+        output, _ = await inspect.communicate()
+        pending = set(containers)
+        for line in output.decode().splitlines():
+            name, _, status = line.strip().lstrip("/").partition(" ")
+            if status in ("healthy", "none"):
+                pending.discard(name)
+        
+        while pending:
+            line = await asyncio.wait_for(events.stdout.readline(),
+                                          timeout=max(0, deadline - time.monotonic()))
+            if not line:
+                break
+            name, _, status = line.decode().strip().partition(" ")
+            if status == "health_status: healthy":
+                pending.discard(name)
+        return not pending
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        events.kill()
+        await events.wait()
@@ -0,0 +1,27 @@
+"""
+TrustLayer AI: Nginx helpers shared by the VM fix scripts
+"""
+import os
+
+import jinja2
+
+from tl_fixops.shell import run_async
+
+# Compiled once per process; every config variant is rendered from nginx.conf.j2
+TEMPLATES = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(os.path.dirname(__file__)),
+    trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=False)
+
+def render_config(dashboard_mode, ipv6=False, proxy_tuning=False, static_files=False, favicon=False,
+                  metrics_stream=False):
+    """Render the Nginx site config for one dashboard mode (proxy, rewrite, redirect or html)"""
+    return TEMPLATES.get_template("nginx.conf.j2").render(
+        dashboard_mode=dashboard_mode, ipv6=ipv6, proxy_tuning=proxy_tuning,
+        static_files=static_files, favicon=favicon, metrics_stream=metrics_stream)
+
+async def reload_nginx():
+    """Gracefully reload Nginx (old workers drain), starting it if it isn't running"""
+    success, output = await run_async(["nginx", "-s", "reload"], "Reloading Nginx")
+    if not success:
+        success, output = await run_async(["systemctl", "start", "nginx"], "Starting Nginx")
+    return success, output
@@ -0,0 +1,43 @@
+"""
+TrustLayer AI: Local HTTP probes shared by the VM fix scripts
+"""
+import asyncio
+import time
+
+import httpx
+
+# One keep-alive client for every local HTTP probe instead of forking curl
+HTTP_CLIENT = httpx.Client(timeout=5.0)
+
+async def probe(url, description=""):
+    """HEAD url with the shared client and return (ok, status_code)"""
+    report = [f"🔧 {description}", f"   HEAD {url}"]
+    
+    try:
+        response = await asyncio.to_thread(HTTP_CLIENT.head, url)
+        ok = response.status_code < 400
+        report.append(f"   {'✅' if ok else '❌'} HTTP {response.status_code}")
+        return ok, response.status_code
+    except httpx.HTTPError as e:
+        report.append(f"   ❌ Error: {e}")
+        return False, None
+    finally:
+        print("\n".join(report))
+
+async def probe_urls(urls):
+    """Probe several URLs concurrently over the shared pool, return {url: status_code}"""
+    results = await asyncio.gather(*(probe(url, f"Testing {url}") for url in urls))
+    return {url: status for url, (_, status) in zip(urls, results)}
+
+async def wait_ready(url, timeout=45, interval=0.1):
+    """Poll url until it answers (anything below 500) or timeout seconds pass"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = await asyncio.to_thread(HTTP_CLIENT.head, url)
+            if response.status_code < 500:
+                return True
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(interval)
+    return False
@@ -0,0 +1,107 @@
+"""
+TrustLayer AI: Shell helpers shared by the VM fix scripts
+"""
+import asyncio
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+from collections import deque
+
+# Commands containing any of these still need /bin/sh; everything else is exec'd directly
+SHELL_METACHARS = "|&;<>$`*?"
+
+OUTPUT_TAIL_LINES = 20
+PREVIEW_LINES = 3
+
+def ensure_root():
+    """Re-exec the running script under sudo once, so no command needs its own sudo"""
+    if os.geteuid() != 0:
+        os.execvp("sudo", ["sudo", "-E", sys.executable, *sys.argv])
+
+async def read_lines(stream, lines):
+    """Drain stream line by line into lines (a bounded deque)"""
+    async for line in stream:
+        lines.append(line.decode(errors="replace").rstrip("\n"))
+
+async def run_async(command, description="", cwd=None, keep_lines=OUTPUT_TAIL_LINES):
+    """Run command (argv list or string) and return result (last keep_lines of output)"""
+    if isinstance(command, str) and not any(c in command for c in SHELL_METACHARS):
+        command = shlex.split(command)
+    shown = shlex.join(command) if isinstance(command, list) else command
+    # Report lines are printed together so concurrent commands don't interleave
+    report = [f"🔧 {description}", f"   Command: {shown}"]
+    
+    try:
+        if isinstance(command, list):
+            proc = await asyncio.create_subprocess_exec(
+                *command, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        else:
+            proc = await asyncio.create_subprocess_shell(
+                command, cwd=cwd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        # Only the tail of each stream is kept, so chatty commands stay in constant memory
+        stdout_lines = deque(maxlen=keep_lines)
+        stderr_lines = deque(maxlen=keep_lines)
+        await asyncio.gather(read_lines(proc.stdout, stdout_lines),
+                             read_lines(proc.stderr, stderr_lines))
+        await proc.wait()
+        stdout = "\n".join(stdout_lines).strip()
+        stderr = "\n".join(stderr_lines).strip()
+        if proc.returncode == 0:
+            report.append(f"   ✅ Success")
+            for line in list(stdout_lines)[-PREVIEW_LINES:]:
+                report.append(f"      {line}")
+            return True, stdout
+        else:
+            report.append(f"   ❌ Failed: {stderr}")
+            return False, stderr
+    except Exception as e:
+        report.append(f"   ❌ Error: {e}")
+        return False, str(e)
+    finally:
+        print("\n".join(report))
+
+def write_atomic(path, data):
+    """Replace path with data via a temp file in the same directory (root only)"""
+    # Temp file in the target directory so os.replace is a same-filesystem rename
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.tmp")
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+def install_file_sync(path, content, description=""):
+    """Atomically replace path with content, str or bytes (sudo tee to path.tmp, then sudo mv, when not root)"""
+    data = content.encode() if isinstance(content, str) else content
+    report = [f"🔧 {description}"]
+    
+    try:
+        if os.geteuid() == 0:
+            report.append(f"   Write: {path}")
+            write_atomic(path, data)
+        else:
+            report.append(f"   Command: sudo tee {path}.tmp && sudo mv -f {path}.tmp {path}")
+            result = subprocess.run(["sudo", "tee", f"{path}.tmp"], input=data,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if result.returncode == 0:
+                result = subprocess.run(["sudo", "mv", "-f", f"{path}.tmp", path],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if result.returncode != 0:
+                error = result.stderr.decode(errors="replace").strip()
+                report.append(f"   ❌ Failed: {error}")
+                return False, error
+        report.append(f"   ✅ Success")
+        return True, ""
+    except Exception as e:
+        report.append(f"   ❌ Error: {e}")
+        return False, str(e)
+    finally:
+        print("\n".join(report))
+
+async def install_file(path, content, description=""):
+    """install_file_sync on a worker thread, for scripts running an event loop"""
+    return await asyncio.to_thread(install_file_sync, path, content, description)